@@ -0,0 +1,92 @@
+"""
+Script to compare the row-by-row index_by_individual with the vectorized
+aggregate_by_individual on synthetic email dataframes, measures compute time
+and writes to disk
+"""
+import json
+import time
+import numpy as np
+import pandas as pd
+from csv_aggregation import index_by_individual, aggregate_by_individual
+
+
+# create a synthetic email-indexed dataframe shaped like the batchN_email_df.csv files
+def synthetic_email_df(num_emails, num_people, num_clubs=500, seed=0):
+    rng = np.random.default_rng(seed)
+    domains = np.array(['college.harvard.edu', 'fas.harvard.edu', 'gmail.com', 'hcs.harvard.edu'], dtype=object)
+    people = np.array(['person' + str(i) + '@' + domains[i % len(domains)] for i in range(num_people)], dtype=object)
+    clubs = np.array(['club' + str(i) for i in range(num_clubs)] + [np.nan], dtype=object)
+    to_idx = rng.integers(0, num_people, num_emails)
+    from_idx = rng.integers(0, num_people, num_emails)
+    # seconds since 2000, written the same way the email dataframes store timestamps
+    seconds = rng.integers(0, 24 * 365 * 24 * 3600, num_emails)
+    timestamps = (pd.Timestamp('2000-01-01') + pd.to_timedelta(seconds, unit='s')).strftime('%Y-%m-%d %H:%M:%S').to_numpy(dtype=object)
+    timestamps[rng.random(num_emails) < 0.001] = np.nan
+    df = pd.DataFrame({'to': people[to_idx],
+                        'from': people[from_idx],
+                        'timestamp': timestamps,
+                        'affiliation': clubs[rng.integers(0, len(clubs), num_emails)],
+                        'to-affiliation': domains[to_idx % len(domains)],
+                        'from-affiliation': domains[from_idx % len(domains)],
+                        'content-length': rng.integers(0, 10000, num_emails),
+                        'topic': rng.integers(0, 7, num_emails)})
+    for col in ['sub-neg', 'sub-neu', 'sub-pos', 'con-neg', 'con-neu', 'con-pos']:
+        df[col] = np.round(rng.random(num_emails), 3)
+    for col in ['sub-com', 'con-com']:
+        df[col] = np.round(rng.uniform(-1, 1, num_emails), 4)
+    for col in ['sub-semitic-wf', 'sub-crypto-wf', 'con-semitic-wf', 'con-crypto-wf']:
+        df[col] = rng.poisson(0.05, num_emails)
+    return df
+
+
+individual_column_names = ['email', 'affiliation', 'avg-content-length', 'first-email-timestamp',
+                            'last-email-timestamp', 'avg-received-sub-neg', 'avg-received-sub-neu',
+                            'avg-received-sub-pos', 'avg-received-sub-com', 'avg-sent-sub-neg',
+                            'avg-sent-sub-neu', 'avg-sent-sub-pos', 'avg-sent-sub-com',
+                            'avg-received-con-neg', 'avg-received-con-neu', 'avg-received-con-pos',
+                            'avg-received-con-com', 'avg-sent-con-neg', 'avg-sent-con-neu',
+                            'avg-sent-con-pos', 'avg-sent-con-com', 'sum-sent-con-semitic-wf',
+                            'sum-sent-con-crypto-wf', 'sum-sent-sub-semitic-wf', 'sum-sent-sub-crypto-wf',
+                            'num-club-affiliations', 'num-emails-sent', 'num-emails-received',
+                            'num-sent-arts', 'num-sent-athletics', 'num-sent-culture', 'num-sent-politics',
+                            'num-sent-preprofessional', 'num-sent-service', 'num-sent-misc',
+                            'num-received-arts', 'num-received-athletics', 'num-received-culture',
+                            'num-received-politics', 'num-received-preprofessional',
+                            'num-received-service', 'num-received-misc']
+
+# frame sizes to benchmark, roughly one person for every 50 emails as in the real corpus
+sizes = [1000000, 5000000, 10000000, 50000000]
+# iterrows takes hours past this many rows, so only run the original aggregation below it
+legacy_row_limit = 1000000
+
+runtimes = {'num-emails': [], 'index-by-individual': [], 'aggregate-by-individual': []}
+for size in sizes:
+    df = synthetic_email_df(size, max(size // 50, 1))
+    print("Synthetic dataframe with {n} emails".format(n=size))
+
+    # vectorized aggregation
+    s = time.time()
+    vectorized_df = aggregate_by_individual(df, individual_column_names)
+    vectorized_time = round(time.time() - s, 4)
+    print("aggregate_by_individual took " + str(vectorized_time) + " seconds.")
+
+    # original aggregation, checked against the vectorized output
+    legacy_time = None
+    if size <= legacy_row_limit:
+        s = time.time()
+        d = index_by_individual(df, individual_column_names)
+        legacy_df = pd.DataFrame.from_dict(d, orient='index', columns=individual_column_names).reset_index(drop=True)
+        legacy_time = round(time.time() - s, 4)
+        print("index_by_individual took " + str(legacy_time) + " seconds.")
+        pd.testing.assert_frame_equal(legacy_df, vectorized_df)
+        print("Outputs are identical.")
+    print("*"*80)
+
+    runtimes['num-emails'].append(size)
+    runtimes['index-by-individual'].append(legacy_time)
+    runtimes['aggregate-by-individual'].append(vectorized_time)
+
+# write to disk
+f = open("./individual_aggregation_runtimes.txt", "w")
+f.write(json.dumps(runtimes))
+f.close()
@@ -0,0 +1,68 @@
+"""
+Script to measure the per-email cost of topic categorization, comparing re-reading
+the six topic keyword files for every email with the TopicLexicon built once,
+prints to the console
+"""
+import time
+import string
+import random
+from collections import defaultdict
+from helpers import TopicLexicon
+
+
+# per-email topic categorization as Extractor.get_email_info used to do it:
+# re-read every keyword file, then probe each keyword set in turn
+def categorize_topic_rereading_files(text, keywords_path='./content-stopwords/topic-keywords/'):
+    keyword_sets = []
+    for topic, file_name in TopicLexicon.topic_files:
+        keywords = set([])
+        f = open(keywords_path + file_name, "r")
+        for x in f:
+            keywords.add(x.lower().strip())
+        f.close()
+        keyword_sets.append((topic, keywords))
+
+    if isinstance(text, float):
+        return 'miscellaneous'
+    topic_wf_dict = defaultdict(lambda: 0)
+    for word in text.lower().split():
+        word = word.translate(str.maketrans('', '', string.punctuation))
+        for topic, keywords in keyword_sets:
+            if word in keywords:
+                topic_wf_dict[topic] += 1
+                break
+    topic = 'miscellaneous'
+    highest_value = 1
+    for key in topic_wf_dict:
+        if topic_wf_dict[key] > highest_value:
+            highest_value = topic_wf_dict[key]
+            topic = key
+    return topic
+
+
+num_emails = 2000
+words_per_email = 300
+
+# synthetic emails mixing topic keywords with filler words
+lexicon = TopicLexicon()
+keywords = list(lexicon.token_topics.keys())
+filler = ['the', 'meeting', 'tonight', 'please', 'join', 'us', 'at', 'for', 'our', 'club', 'email', 'list']
+random.seed(0)
+emails = [' '.join(random.choice(keywords) if random.random() < 0.1 else random.choice(filler)
+                for _ in range(words_per_email)) for _ in range(num_emails)]
+
+# before: keyword files read for every email
+s = time.time()
+before_topics = [categorize_topic_rereading_files(email) for email in emails]
+before = (time.time() - s) / num_emails
+
+# after: lexicon compiled once, one dictionary probe per token
+s = time.time()
+lexicon = TopicLexicon()
+after_topics = [lexicon.categorize(email) for email in emails]
+after = (time.time() - s) / num_emails
+
+assert before_topics == after_topics
+print("Re-reading keyword files: " + str(round(before * 1e6, 2)) + " microseconds per email.")
+print("Compiled topic lexicon: " + str(round(after * 1e6, 2)) + " microseconds per email.")
+print("Speedup: " + str(round(before / after, 2)) + "x")
@@ -6,6 +6,9 @@ import pandas as pd
 import numpy as np
 import os
 import sys
+import itertools
+import multiprocessing
+from functools import partial
 from tqdm import tqdm
 from helpers import *
 
@@ -68,31 +71,117 @@ def process_emails_for_topic_models(df, extractor, column_names):
     return new_df
 
 
-# concatenate and return a dataframe with all raw email data
-def full_email_df(batch_nums, email_columns, parent_dir=False, email_count_limit=float('inf')):
-    email_df = pd.DataFrame(columns=email_columns)
+# column types of the batchN_email_df.csv files, so streamed chunks come back typed
+email_column_dtypes = {'id': 'object', 'parent': 'object', 'to': 'object', 'from': 'object',
+                        'timestamp': 'object', 'affiliation': 'object', 'to-affiliation': 'category',
+                        'from-affiliation': 'category', 'content-length': 'int64',
+                        'sub-neg': 'float64', 'sub-neu': 'float64', 'sub-pos': 'float64', 'sub-com': 'float64',
+                        'con-neg': 'float64', 'con-neu': 'float64', 'con-pos': 'float64', 'con-com': 'float64',
+                        'con-semitic-wf': 'int32', 'con-crypto-wf': 'int32', 'sub-semitic-wf': 'int32',
+                        'sub-crypto-wf': 'int32', 'con-felipes-wf': 'int32', 'con-jefes-wf': 'int32',
+                        'sub-felipes-wf': 'int32', 'sub-jefes-wf': 'int32', 'topic': 'int8',
+                        'list-name': 'object'}
 
-    # for each batch number provided
-    for batch_num in tqdm(batch_nums):
-        path = None
-        # when running from 'complete-scripts' folder
-        if parent_dir:
-            path = '../dataframes/batch' + str(batch_num) + '_email_df.csv'
-        # when running from main folder
-        else:
-            path = './dataframes/batch' + str(batch_num) + '_email_df.csv'
 
-        df = None
-        # hardcoded threshold because no batch of mailing lists has more than a million emails
-        if email_count_limit < 1000000:
-            df = pd.read_csv(path, usecols=email_columns, nrows=email_count_limit)
-        else:
-            df = pd.read_csv(path, usecols=email_columns)
+# path to a batch's email-indexed dataframe
+def email_df_path(batch_num, parent_dir=False):
+    return dataframe_path('batch' + str(batch_num) + '_email_df', parent_dir, extension='.csv')
+
 
-        # concatenate into final dataframe
-        email_df = pd.concat([email_df, df])
+# stream raw email data batch by batch in typed chunks, only reading the requested columns
+def iter_email_df(batch_nums, email_columns, parent_dir=False, email_count_limit=float('inf'), chunksize=100000):
+    dtypes = {col: email_column_dtypes[col] for col in email_columns if col in email_column_dtypes}
+    # hardcoded threshold because no batch of mailing lists has more than a million emails
+    nrows = int(email_count_limit) if email_count_limit < 1000000 else None
 
-    return email_df
+    # for each batch number provided
+    for batch_num in tqdm(batch_nums):
+        with pd.read_csv(email_df_path(batch_num, parent_dir), usecols=email_columns, dtype=dtypes,
+                        nrows=nrows, chunksize=chunksize) as reader:
+            for chunk in reader:
+                yield chunk
+
+
+# fold a function over streamed email chunks, so that a query only keeps its running state in memory
+def fold_email_df(batch_nums, email_columns, fold, initial, parent_dir=False, email_count_limit=float('inf'), chunksize=100000):
+    state = initial
+    for chunk in iter_email_df(batch_nums, email_columns, parent_dir, email_count_limit, chunksize):
+        state = fold(state, chunk)
+    return state
+
+
+# concatenate and return a dataframe with all raw email data. If a chunksize is given,
+# return a generator over typed chunks instead of materializing every batch
+def full_email_df(batch_nums, email_columns, parent_dir=False, email_count_limit=float('inf'), chunksize=None):
+    if chunksize is not None:
+        return iter_email_df(batch_nums, email_columns, parent_dir, email_count_limit, chunksize)
+
+    # concatenate once at the end rather than copying the growing dataframe for every batch
+    frames = list(iter_email_df(batch_nums, email_columns, parent_dir, email_count_limit, chunksize=1000000))
+    if not frames:
+        return pd.DataFrame(columns=email_columns)
+    return pd.concat(frames)[email_columns]
+
+
+# columns stored as datetime64 and categorical in the columnar dataframes
+timestamp_columns = ['timestamp', 'first-email-timestamp', 'last-email-timestamp']
+categorical_columns = ['affiliation', 'to-affiliation', 'from-affiliation']
+
+
+# path to a dataframe on disk, written as csv or in columnar (parquet) format
+def dataframe_path(df_name, parent_dir=False, extension='.parquet'):
+    # when running from 'complete-scripts' folder
+    if parent_dir:
+        return '../dataframes/' + df_name + extension
+    # when running from main folder
+    return './dataframes/' + df_name + extension
+
+
+# give a dataframe read from csv proper dtypes, so timestamps are not reparsed as strings
+def type_columns(df):
+    for col in df.columns:
+        if col in timestamp_columns:
+            # timestamps carry their own utc offsets, so normalize them to naive utc
+            df[col] = pd.to_datetime(df[col], format='ISO8601', utc=True, errors='coerce').dt.tz_localize(None)
+        elif col in categorical_columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+# convert a csv dataframe on disk to a typed columnar dataframe next to it. Sorting by a
+# timestamp column keeps row group statistics tight, so timestamp predicates skip more of the file
+def write_columnar_df(df_name, parent_dir=False, sort_by=None, row_group_size=100000):
+    # every dataframe in the repo is written with its index as the first column
+    df = pd.read_csv(dataframe_path(df_name, parent_dir, extension='.csv'), index_col=0)
+    df = type_columns(df)
+    if sort_by is not None:
+        df = df.sort_values(sort_by, kind='stable')
+    df.to_parquet(dataframe_path(df_name, parent_dir), index=False, row_group_size=row_group_size)
+    return df
+
+
+# read a typed columnar dataframe. Timestamp ranges (inclusive start, exclusive end) and
+# affiliations are pushed down to the parquet reader, which skips row groups outside of them
+def read_columnar_df(df_name, columns=None, parent_dir=False, timestamp_range=None, timestamp_column='timestamp',
+                    affiliations=None, affiliation_column='affiliation'):
+    filters = []
+    if timestamp_range is not None:
+        if timestamp_range[0] is not None:
+            filters.append((timestamp_column, '>=', pd.Timestamp(timestamp_range[0])))
+        if timestamp_range[1] is not None:
+            filters.append((timestamp_column, '<', pd.Timestamp(timestamp_range[1])))
+    if affiliations is not None:
+        filters.append((affiliation_column, 'in', list(affiliations)))
+    return pd.read_parquet(dataframe_path(df_name, parent_dir), columns=columns, filters=filters or None)
+
+
+# read the columnar email dataframes of the given batches into one dataframe
+def columnar_email_df(batch_nums, email_columns, parent_dir=False, timestamp_range=None, affiliations=None,
+                    affiliation_column='affiliation'):
+    frames = [read_columnar_df('batch' + str(batch_num) + '_email_df', email_columns, parent_dir, timestamp_range,
+                            affiliations=affiliations, affiliation_column=affiliation_column)
+                for batch_num in tqdm(batch_nums)]
+    return pd.concat(frames, ignore_index=True)
 
 
 # aggregate email information to form individually-indexed dataframe
@@ -100,10 +189,7 @@ def create_individual_db_from_email_dfs(batch_nums, email_columns, individual_co
     # construct full raw email dataframe
     email_df = full_email_df(batch_nums, email_columns, parent_dir)
     # aggregate by individual email address
-    individual_dict = index_by_individual(email_df, individual_columns)
-    # create final dataframe
-    final_df = pd.DataFrame.from_dict(individual_dict, orient='index', columns=individual_columns)
-    final_df = final_df.reset_index(drop=True)
+    final_df = aggregate_by_individual(email_df, individual_columns)
     return final_df
 
 
@@ -228,6 +314,118 @@ def index_by_individual(df, individual_columns):
     return d
 
 
+# vectorized individual aggregation, produces the same dataframe as index_by_individual
+# in a handful of groupby/bincount passes instead of one python loop per email
+def aggregate_by_individual(df, individual_columns):
+    topics = ['arts', 'athletics', 'culture', 'misc', 'politics', 'preprofessional', 'service']
+    sentiment_columns = ['sub-neg', 'sub-neu', 'sub-pos', 'sub-com', 'con-neg', 'con-neu', 'con-pos', 'con-com']
+    wf_columns = ['sub-semitic-wf', 'sub-crypto-wf', 'con-semitic-wf', 'con-crypto-wf']
+    n = len(df)
+    rows = np.arange(n)
+
+    # interleave receivers and senders so that the order of first appearance matches the
+    # insertion order of the dictionary built by index_by_individual
+    interleaved = np.empty(2 * n, dtype=object)
+    interleaved[0::2] = df['to'].to_numpy(dtype=object)
+    interleaved[1::2] = df['from'].to_numpy(dtype=object)
+    codes, emails = pd.factorize(interleaved, use_na_sentinel=False)
+    to_codes, from_codes = codes[0::2], codes[1::2]
+    num_people = len(emails)
+
+    # factorize hands out codes in order of appearance, so a slot is someone's first
+    # appearance exactly when the running maximum of the codes increases
+    running_max = np.maximum.accumulate(codes)
+    first_slot = np.flatnonzero(np.concatenate(([True], running_max[1:] > running_max[:-1])))
+
+    # when someone emails themselves in the row they first appear in, index_by_individual
+    # overwrites the receiving entry with the sending entry, dropping the receiving side of that row
+    self_first = (to_codes == from_codes) & (first_slot[to_codes] == 2 * rows)
+    received = ~self_first
+    first_slot[to_codes[self_first]] += 1
+
+    # domain affiliation is taken from the row an individual first appears in
+    interleaved_affiliations = np.empty(2 * n, dtype=object)
+    interleaved_affiliations[0::2] = df['to-affiliation'].to_numpy(dtype=object)
+    interleaved_affiliations[1::2] = df['from-affiliation'].to_numpy(dtype=object)
+
+    out = {'email': emails, 'affiliation': interleaved_affiliations[first_slot]}
+
+    # number of emails sent and received
+    num_sent = np.bincount(from_codes, minlength=num_people)
+    num_received = np.bincount(to_codes[received], minlength=num_people)
+    out['num-emails-sent'] = num_sent
+    out['num-emails-received'] = num_received
+
+    # emails sent and received by topic
+    topic_codes = df['topic'].to_numpy().astype(np.int64)
+    sent_topics = np.bincount(from_codes * len(topics) + topic_codes,
+                            minlength=num_people * len(topics)).reshape(num_people, len(topics))
+    received_topics = np.bincount(to_codes[received] * len(topics) + topic_codes[received],
+                            minlength=num_people * len(topics)).reshape(num_people, len(topics))
+    for i, topic in enumerate(topics):
+        out['num-sent-' + topic] = sent_topics[:, i]
+        out['num-received-' + topic] = received_topics[:, i]
+
+    # averages of sent and received sentiments. bincount adds the weights in row order,
+    # so the sums match the sequential ones exactly before rounding
+    for col in sentiment_columns:
+        values = df[col].to_numpy(dtype=np.float64)
+        sent_sums = np.bincount(from_codes, weights=values, minlength=num_people)
+        received_sums = np.bincount(to_codes[received], weights=values[received], minlength=num_people)
+        out['avg-sent-' + col] = finalize_averages(sent_sums, num_sent)
+        out['avg-received-' + col] = finalize_averages(received_sums, num_received)
+
+    # average sent content length
+    content_lengths = df['content-length'].to_numpy(dtype=np.float64)
+    out['avg-content-length'] = finalize_averages(np.bincount(from_codes, weights=content_lengths,
+                                                            minlength=num_people), num_sent)
+
+    # sums of sent word frequencies (leaving out jefes and felipes stopwords)
+    for col in wf_columns:
+        # full_email_df concatenates onto an empty frame, which leaves object columns behind
+        values = pd.to_numeric(df[col])
+        sums = np.bincount(from_codes, weights=values.to_numpy(dtype=np.float64), minlength=num_people)
+        if values.dtype.kind in 'iu':
+            sums = sums.astype(np.int64)
+        out['sum-sent-' + col] = sums
+
+    # number of distinct club affiliations over sent and received emails
+    affiliation_codes, affiliation_names = pd.factorize(df['affiliation'].to_numpy(dtype=object), use_na_sentinel=False)
+    pairs = pd.unique(np.concatenate((to_codes, from_codes)) * max(len(affiliation_names), 1) +
+                      np.concatenate((affiliation_codes, affiliation_codes)))
+    out['num-club-affiliations'] = np.bincount(pairs // max(len(affiliation_names), 1), minlength=num_people)
+
+    # first and last sent email timestamps. Timestamps are compared through their sorted codes;
+    # a missing timestamp on someone's first sent email sticks, as it does in index_by_individual
+    timestamp_codes, timestamps = pd.factorize(df['timestamp'].to_numpy(), sort=True)
+    timestamp_codes = pd.Series(timestamp_codes)
+    grouped_codes = timestamp_codes.groupby(from_codes)
+    first_codes = grouped_codes.first()
+    valid = timestamp_codes >= 0
+    bounds = timestamp_codes[valid].groupby(from_codes[valid.to_numpy()]).agg(['min', 'max'])
+    first_timestamps = np.full(num_people, None, dtype=object)
+    last_timestamps = np.full(num_people, None, dtype=object)
+    first_timestamps[first_codes.index] = np.nan
+    last_timestamps[first_codes.index] = np.nan
+    bounds = bounds[first_codes[bounds.index] >= 0]
+    first_timestamps[bounds.index] = timestamps[bounds['min'].to_numpy()]
+    last_timestamps[bounds.index] = timestamps[bounds['max'].to_numpy()]
+    out['first-email-timestamp'] = first_timestamps
+    out['last-email-timestamp'] = last_timestamps
+
+    return pd.DataFrame({col: out[col] for col in individual_columns})
+
+
+# divide sums by counts where the count is positive, rounding like index_by_individual
+def finalize_averages(sums, counts):
+    if not (counts > 0).any():
+        return np.zeros(len(sums), dtype=np.int64)
+    averages = np.zeros(len(sums))
+    nonzero = np.flatnonzero(counts > 0)
+    averages[nonzero] = [round(s / c, 4) for s, c in zip(sums[nonzero].tolist(), counts[nonzero].tolist())]
+    return averages
+
+
 # initialize an entry in the individually-indexed dataframe
 def initialize_person_entry(email, affiliation, from_preprocessed=False):
     if not from_preprocessed:
@@ -250,15 +448,15 @@ def initialize_person_entry(email, affiliation, from_preprocessed=False):
                 "num-received-politics": 0, "num-received-preprofessional": 0, "num-received-service": 0, "num-received-misc": 0}
 
 
-# create a processed email-indexed metadata dataframe
-def create_email_pd(batch_nums, column_names, content_topics, list_count_limit=float('inf'), parent_dir=False):
-    final_df = pd.DataFrame(columns=column_names)
-    extractor = Extractor(column_names, content_topics)
-    list_counter = 0
+# create a processed email-indexed metadata dataframe. List directories are processed in
+# parallel by num_workers processes (all cores by default), each owning one Extractor. Sentiment
+# scores are kept in an sqlite store at sentiment_cache_path, if given, and reused across runs
+def create_email_pd(batch_nums, column_names, content_topics, list_count_limit=float('inf'), parent_dir=False, num_workers=None,
+                    sentiment_cache_path=None):
+    list_paths = []
 
     # for each batch number provided
     for batch_num in batch_nums:
-        paths = []
         list_dirs = []
         scp_path = ""
         # when running from 'complete-scripts' folder
@@ -268,33 +466,78 @@ def create_email_pd(batch_nums, column_names, content_topics, list_count_limit=f
         else:
             scp_path = './scp-results/batch' + str(batch_num) + '/'
 
-        # find individual list directories
+        # find individual list directories, sorted so the output order is deterministic
         for subdir, dirs, files in os.walk(scp_path):
             for dir in dirs:
                 list_dirs.append(dir)
+        list_paths += [scp_path + list_dir for list_dir in sorted(list_dirs)]
 
-        # for each list directory
-        for list_dir in tqdm(list_dirs):
-            # find the files
-            file_list = os.listdir(scp_path + list_dir)
-            # for each file, pull out csv
-            for file in file_list:
-                df = pd.read_csv(scp_path + list_dir + '/' + file)
-                df = process_email_csv(df, extractor, column_names)
-                final_df = pd.concat([final_df, df])
-
-            list_counter += 1
-            # break if there's a limit
-            if list_counter > list_count_limit:
-                break
+    # the limit is checked after a list is processed, so one more list than the limit is included
+    if list_count_limit < len(list_paths):
+        list_paths = list_paths[:int(list_count_limit) + 1]
 
-        # break if there's a limit
-        if list_counter > list_count_limit:
-            break
+    if num_workers is None:
+        num_workers = os.cpu_count()
 
+    # process each list directory into columnar lists
+    list_columns = []
+    if num_workers <= 1:
+        init_extractor_worker(column_names, content_topics, sentiment_cache_path)
+        for list_path in tqdm(list_paths):
+            list_columns.append(process_list_dir(list_path, column_names))
+    else:
+        with multiprocessing.Pool(num_workers, initializer=init_extractor_worker,
+                                initargs=(column_names, content_topics, sentiment_cache_path)) as pool:
+            # imap returns results in the order of list_paths
+            for columns in tqdm(pool.imap(partial(process_list_dir, column_names=column_names), list_paths),
+                                total=len(list_paths)):
+                list_columns.append(columns)
+
+    # merge once at the end
+    final_df = pd.DataFrame({col: list(itertools.chain.from_iterable(columns[col] for columns in list_columns))
+                            for col in column_names}, columns=column_names)
     return final_df
 
 
+# extractor owned by the current worker process of create_email_pd
+worker_extractor = None
+
+
+# create the extractor of a worker process
+def init_extractor_worker(column_names, content_topics, sentiment_cache_path=None):
+    global worker_extractor
+    worker_extractor = Extractor(column_names, content_topics, sentiment_cache_path=sentiment_cache_path)
+
+
+# process every csv of a list directory with the worker's extractor, returning columnar lists.
+# A 'list-name' column is filled with the name of the list directory
+def process_list_dir(list_path, column_names):
+    email_columns = [col for col in column_names if col != 'list-name']
+    columns = {col: [] for col in email_columns}
+    # for each file, pull out csv
+    for file in sorted(os.listdir(list_path)):
+        for df in read_email_chunks(list_path + '/' + file):
+            append_email_rows(df, worker_extractor, email_columns, columns)
+    worker_extractor.sentiment_scorer.flush()
+    if 'list-name' in column_names:
+        columns['list-name'] = [os.path.basename(list_path)] * len(columns['id'])
+    return columns
+
+
+# yield the chunks of a file of scp'd emails: a csv file is one chunk, and a parquet file is read
+# one row group (one chunk as written on the server) at a time, so a list is never loaded at once
+def read_email_chunks(file_path):
+    if file_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(file_path)
+        for i in range(parquet_file.num_row_groups):
+            df = parquet_file.read_row_group(i).to_pandas()
+            # missing and empty values come back as nan, as they do from read_csv
+            yield df.replace({'': np.nan, None: np.nan})
+    else:
+        yield pd.read_csv(file_path)
+
+
 # create a processed individually-indexed dataframe
 def create_full_pd(batch_nums, column_names, list_count_limit=float('inf'), parent_dir=False):
     final_df = pd.DataFrame(columns=column_names)
@@ -339,10 +582,10 @@ def create_full_pd(batch_nums, column_names, list_count_limit=float('inf'), pare
     return final_df
 
 
-# aggregate information on individuals and return as a dictionary
-def create_individual_db_dict(batch_nums, columns, list_count_limit=float('inf'), remove_metadata=True):
+# aggregate information on individuals and return as an IndividualTable
+def create_individual_table(batch_nums, columns, list_count_limit=float('inf')):
 
-    d = {}
+    table = IndividualTable()
     list_counter = 0
     extractor = Extractor(columns)
 
@@ -364,7 +607,7 @@ def create_individual_db_dict(batch_nums, columns, list_count_limit=float('inf')
             for file in file_list:
 
                 file_path = scp_path + list_dir + '/' + file
-                d = process_csv(d, file_path, extractor)
+                table = process_csv(table, file_path, extractor)
 
             list_counter += 1
             # break if there's a limit
@@ -375,82 +618,43 @@ def create_individual_db_dict(batch_nums, columns, list_count_limit=float('inf')
         if list_counter > list_count_limit:
             break
 
-    # remove large columns before writing
-    if remove_metadata:
-        # delete the set of club affiliations, only keep the number of affiliations
-        for key in d:
-            del d[key]['club_affiliations']
-
-    return d
+    return table
 
 
 # process emails in a given batch dataframe
 def process_email_csv(df, extractor, column_names):
-    new_df = pd.DataFrame(columns=column_names)
+    columns = {col: [] for col in column_names}
+    append_email_rows(df, extractor, column_names, columns)
+    return pd.DataFrame(columns, columns=column_names)
+
+
+# process emails in a given batch dataframe, appending each column's values to a list
+def append_email_rows(df, extractor, column_names, columns):
+    # score the file's unique subjects and contents in one batch, get_email_info then hits the cache
+    if 'subject' in df.columns and 'content' in df.columns:
+        extractor.sentiment_scorer.score_batch([reformat(text) for text in df['subject']] +
+                                            [reformat(text) for text in df['content']])
+    # normalize the file's unique to/from headers in one call, get_email_info then hits the table
+    if 'to' in df.columns and 'from' in df.columns:
+        extractor.extract_address_columns(df)
+    # parse the file's unique date headers in one call
+    if 'date' in df.columns:
+        extractor.extract_timestamp_column(df['date'])
     for i, row in df.iterrows():
         d = extractor.get_email_info(row)
         new_row = [d[col] for col in column_names]
         # accidental empty first row was appended to some of the scp'd files, so hardcoded to ignore
         if new_row[4] is None and new_row[2] == -1 and new_row[3] == -1:
             continue
-        new_df.loc[len(new_df.index)] = new_row
-    return new_df
+        for col, value in zip(column_names, new_row):
+            columns[col].append(value)
+    return columns
 
 
-# process emails from a given file path
-def process_csv(d, file_path, extractor):
+# process emails from a given file path into the individual table
+def process_csv(table, file_path, extractor):
     df = pd.read_csv(file_path)
     for i, row in df.iterrows():
-        # process the row
-        extract = extractor.parse(row)
-        # create dictionaries to update senders and receivers
-        to_dict = {}
-        from_dict = {}
-        if extract['to'] in d:
-            to_dict = d[extract['to']]
-        else:
-            to_dict = initialize_person_entry(extract['to'], extract['to-affiliation'])
-        if extract['from'] in d:
-            from_dict = d[extract['from']]
-        else:
-            from_dict = initialize_person_entry(extract['from'], extract['from-affiliation'])
-
-
-        # increment num emails
-        from_dict['num_emails_sent'] += 1
-        to_dict['num_emails_received'] += 1
-
-        # only do these calculations if they are needed in the specified df
-        if 'num_club_affiliations' in extractor.columns:
-            # increment num_club_affiliations
-            if extract['club-affiliation'] and extract['club-affiliation'] not in to_dict['club_affiliations']:
-                to_dict['club_affiliations'].add(extract['club-affiliation'])
-                to_dict['num_club_affiliations'] += 1
-            if extract['club-affiliation'] and extract['club-affiliation'] not in from_dict['club_affiliations']:
-                from_dict['club_affiliations'].add(extract['club-affiliation'])
-                from_dict['num_club_affiliations'] += 1
-
-        # expand the inner sentiment dictionary to be plain columns in the final dictionary
-        if 'avg_sent_sentiment' in extractor.columns or 'avg_received_sentiment' in extractor.columns:
-            # update average sentiments on receiving end
-            if extract['content-sentiment'] is not None:
-                received_sentiments = to_dict['avg_received_sentiment']
-                for key in received_sentiments:
-                    received_sentiments[key] = round(((to_dict['num_emails_received'] - 1) * received_sentiments[key] + extract['content-sentiment'][key]) / to_dict['num_emails_received'], 4)
-                to_dict['avg_received_sentiment'] = received_sentiments
-
-                # update average sentiments on sending end
-                sent_sentiments = from_dict['avg_sent_sentiment']
-                for key in sent_sentiments:
-                    sent_sentiments[key] = round(((from_dict['num_emails_sent'] - 1) * sent_sentiments[key] + extract['content-sentiment'][key]) / from_dict['num_emails_sent'], 4)
-                from_dict['avg_sent_sentiment'] = sent_sentiments
-
-        if 'avg_sent_content_length' in extractor.columns:
-            # update sent content length
-            from_dict['avg_sent_content_length'] = round(((from_dict['num_emails_sent'] - 1) * from_dict['avg_sent_content_length'] + extract['content-length']) / from_dict['num_emails_sent'], 4)
-
-        # update global dictionary
-        d[extract['to']] = to_dict
-        d[extract['from']] = from_dict
-
-    return d
+        # process the row and update the sender and receiver
+        table.add_email(extractor.parse(row), extractor.columns)
+    return table
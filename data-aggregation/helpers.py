@@ -3,47 +3,46 @@ Helper objects/functions for data cleaning and aggregation
 """
 import re
 import numpy as np
+import pandas as pd
 import nltk
 from nltk.sentiment import SentimentIntensityAnalyzer
 from dateutil import parser
 from collections import defaultdict
 import string
+import hashlib
+import sqlite3
+import multiprocessing
+from array import array
+from cachetools import LRUCache
 
 """
 Extractor object used to clean email data. Content stopwords are not included in
 this repo for security reasons.
 """
 class Extractor():
-    def __init__(self, columns_of_interest, content_topics=None, parent_dir=False):
+    def __init__(self, columns_of_interest, content_topics=None, parent_dir=False, sentiment_cache_path=None):
         self.club_names = get_list_names(parent_dir)
         self.sia = SentimentIntensityAnalyzer()
+        self.sentiment_scorer = SentimentScorer(self.sia, cache_path=sentiment_cache_path)
+        # memoized (address, affiliation) of raw to/from header strings, which repeat heavily
+        self.addresses = LRUCache(maxsize=1000000)
+        # memoized utc timestamps of raw date header strings
+        self.timestamps = LRUCache(maxsize=1000000)
         self.columns = set(columns_of_interest)
         self.topic_mapping = {'arts': 0, 'athletics': 1, 'culture': 2,
                             'miscellaneous': 3, 'politics': 4, 'preprofessional': 5, 'service': 6}
+        # topic keywords are loaded once here when parsing full email metadata, otherwise on first use
+        self.topic_lexicon = None
+        if content_topics is not None:
+            self.topic_lexicon = TopicLexicon()
 
         # if the content_topics argument is passed in, load in the according stopwords
+        self.stopword_counter = None
         if content_topics is not None:
             self.stopwords = set(nltk.corpus.stopwords.words("english"))
-            if 'semitism' in content_topics:
-                self.semitism_stopwords = []
-                f = open("./content-stopwords/semitism.txt", "r")
-                for x in f:
-                    self.semitism_stopwords.append(x.strip())
-            if 'crypto' in content_topics:
-                self.crypto_stopwords = []
-                f = open("./content-stopwords/crypto.txt", "r")
-                for x in f:
-                    self.crypto_stopwords.append(x.strip())
-            if 'felipes' in content_topics:
-                self.felipes_stopwords = []
-                f = open("./content-stopwords/felipes.txt", "r")
-                for x in f:
-                    self.felipes_stopwords.append(x.strip())
-            if 'jefes' in content_topics:
-                self.jefes_stopwords = []
-                f = open("./content-stopwords/jefes.txt", "r")
-                for x in f:
-                    self.jefes_stopwords.append(x.strip())
+            self.stopword_counter = StopwordCounter(content_topics, self.stopwords)
+        # word frequency column names of each content topic, new topics default to their own name
+        self.wf_column_names = {'semitism': 'semitic', 'crypto': 'crypto', 'felipes': 'felipes', 'jefes': 'jefes'}
 
 
     # parse meta data for an individual email
@@ -61,15 +60,11 @@ class Extractor():
         else:
             content = reformat(entry['content'])
             subject = reformat(entry['subject'])
-            to = self.extract_email_address(entry['to'])
-            from_ = self.extract_email_address(entry['from'])
+            to, to_affiliation = self.normalize_address(entry['to'])
+            from_, from_affiliation = self.normalize_address(entry['from'])
             parent = entry['parent-id']
-            timestamp = None
             # sometimes the data is nan, ignore
-            try:
-                timestamp =  parser.parse(entry['date'])
-            except:
-                timestamp = None
+            timestamp = self.parse_timestamp(entry['date'])
 
             length = 0
             if isinstance(content, str):
@@ -82,42 +77,13 @@ class Extractor():
                 'parent': parent,
                 'timestamp': timestamp,
                 'content-length': length,
-                'to-affiliation': self.extract_affiliation(to),
-                'from-affiliation': self.extract_affiliation(from_)}
+                'to-affiliation': to_affiliation,
+                'from-affiliation': from_affiliation}
 
 
             # determine topic
-            # create sets of topic words
-            self.service_keywords = set([])
-            f = open("./content-stopwords/topic-keywords/service.txt", "r")
-            for x in f:
-                self.service_keywords.add(x.lower().strip())
-            f.close()
-            self.arts_keywords = set([])
-            f = open("./content-stopwords/topic-keywords/creative-and-performing-arts.txt", "r")
-            for x in f:
-                self.arts_keywords.add(x.lower().strip())
-            f.close()
-            self.culture_keywords = set([])
-            f = open("./content-stopwords/topic-keywords/culture-and-identity.txt", "r")
-            for x in f:
-                self.culture_keywords.add(x.lower().strip())
-            f.close()
-            self.politics_keywords = set([])
-            f = open("./content-stopwords/topic-keywords/government-and-politics.txt", "r")
-            for x in f:
-                self.politics_keywords.add(x.lower().strip())
-            f.close()
-            self.athletics_keywords = set([])
-            f = open("./content-stopwords/topic-keywords/athletics.txt", "r")
-            for x in f:
-                self.athletics_keywords.add(x.lower().strip())
-            f.close()
-            self.preprofessional_keywords = set([])
-            f = open("./content-stopwords/topic-keywords/preprofessional-opportunities.txt", "r")
-            for x in f:
-                self.preprofessional_keywords.add(x.lower().strip())
-            f.close()
+            if self.topic_lexicon is None:
+                self.topic_lexicon = TopicLexicon()
             d['topic'] = self.topic_mapping[self.categorize_topic(content)]
 
             # find affiliation
@@ -149,64 +115,18 @@ class Extractor():
                 d['con-pos'] = 0
                 d['con-com'] = 0
 
-            # find word frequency distributions
-            con_word_freq = self.find_word_freq(content)
-            sub_word_freq = self.find_word_freq(subject)
-
-            # count relevant stopwords
-            content_semitic_word_freq = self.count_semitic_stopwords(con_word_freq)
-            content_crypto_word_freq = self.count_crypto_stopwords(con_word_freq)
-            subject_semitic_word_freq = self.count_semitic_stopwords(sub_word_freq)
-            subject_crypto_word_freq = self.count_crypto_stopwords(sub_word_freq)
-            content_felipes_word_freq = self.count_felipes_stopwords(con_word_freq)
-            content_jefes_word_freq = self.count_jefes_stopwords(con_word_freq)
-            subject_felipes_word_freq = self.count_felipes_stopwords(sub_word_freq)
-            subject_jefes_word_freq = self.count_jefes_stopwords(sub_word_freq)
-
-            # expand to output dictionary
-            d['con-semitic-wf'] = content_semitic_word_freq
-            d['con-crypto-wf'] = content_crypto_word_freq
-            d['sub-semitic-wf'] = subject_semitic_word_freq
-            d['sub-crypto-wf'] = subject_crypto_word_freq
-
-            d['con-felipes-wf'] = content_felipes_word_freq
-            d['con-jefes-wf'] = content_jefes_word_freq
-            d['sub-felipes-wf'] = subject_felipes_word_freq
-            d['sub-jefes-wf'] = subject_jefes_word_freq
+            # count relevant stopwords of every content topic, one tokenization pass per text
+            for prefix, text in [('con', content), ('sub', subject)]:
+                counts = self.stopword_counter.count(text)
+                for topic, count in zip(self.stopword_counter.lexicons, counts):
+                    d[prefix + '-' + self.wf_column_names.get(topic, topic) + '-wf'] = count
 
         return d
 
 
     # count keywords in an email's content, categorize the topic
     def categorize_topic(self, text):
-        if isinstance(text, float):
-            return 'miscellaneous'
-        topic_wf_dict = defaultdict(lambda: 0)
-        text = text.lower()
-        words = text.split()
-        num_words = len(words)
-        for word in words:
-            word = word.translate(str.maketrans('', '', string.punctuation))
-            if word in self.service_keywords:
-                topic_wf_dict['service'] += 1
-            elif word in self.arts_keywords:
-                topic_wf_dict['arts'] += 1
-            elif word in self.culture_keywords:
-                topic_wf_dict['culture'] += 1
-            elif word in self.politics_keywords:
-                topic_wf_dict['politics'] += 1
-            elif word in self.athletics_keywords:
-                topic_wf_dict['athletics'] += 1
-            elif word in self.preprofessional_keywords:
-                topic_wf_dict['preprofessional'] += 1
-        topic = 'miscellaneous'
-        # use the highest count value to categorize
-        highest_value = 1
-        for key in topic_wf_dict:
-            if topic_wf_dict[key] > highest_value:
-                highest_value = topic_wf_dict[key]
-                topic = key
-        return topic
+        return self.topic_lexicon.categorize(text)
 
 
     # find word frequency distribution of given text
@@ -226,34 +146,6 @@ class Extractor():
         # calculate word frequency distribution
         return nltk.FreqDist(word_list)
 
-    # count stopwords relating to Felipe's
-    def count_felipes_stopwords(self, fd):
-        counter = 0
-        for stopword in self.felipes_stopwords:
-            counter += fd[stopword]
-        return counter
-
-    # count stopwords relating to Jefe's
-    def count_jefes_stopwords(self, fd):
-        counter = 0
-        for stopword in self.jefes_stopwords:
-            counter += fd[stopword]
-        return counter
-
-    # count stopwords relating to anti-semitism
-    def count_semitic_stopwords(self, fd):
-        counter = 0
-        for stopword in self.semitism_stopwords:
-            counter += fd[stopword]
-        return counter
-
-    # count stopwords relating to crypto
-    def count_crypto_stopwords(self, fd):
-        counter = 0
-        for stopword in self.crypto_stopwords:
-            counter += fd[stopword]
-        return counter
-
 
     # baseline email parsing
     def parse(self, entry):
@@ -292,13 +184,42 @@ class Extractor():
         if isinstance(text, float):
             return -1
         # search for email
-        match = re.search(r'[\w.+-]+@[\w-]+\.[\w.-]+', text)
+        match = email_address_pattern.search(text)
         # sometimes undisclosed recipients
         if match is None:
             return text
         return match.group(0)
 
 
+    # extract the email address and its domain affiliation from a raw header string, memoized
+    def normalize_address(self, text):
+        # nan values are not hashable consistently, so skip the table
+        if isinstance(text, float):
+            return -1, ""
+        pair = self.addresses.get(text)
+        if pair is None:
+            address = self.extract_email_address(text)
+            pair = (address, self.extract_affiliation(address))
+            self.addresses[text] = pair
+        return pair
+
+
+    # extract the to, from, to-affiliation and from-affiliation columns of a whole batch dataframe,
+    # normalizing each unique raw header string once
+    def extract_address_columns(self, df):
+        columns = {}
+        for side in ['to', 'from']:
+            codes, uniques = pd.factorize(df[side])
+            # missing headers have code -1, which indexes the nan entry appended last
+            pairs = [self.normalize_address(text) for text in uniques] + [(-1, "")]
+            addresses = np.empty(len(pairs), dtype=object)
+            addresses[:] = [pair[0] for pair in pairs]
+            affiliations = np.array([pair[1] for pair in pairs], dtype=object)
+            columns[side] = addresses[codes]
+            columns[side + '-affiliation'] = affiliations[codes]
+        return pd.DataFrame(columns, index=df.index, columns=['to', 'from', 'to-affiliation', 'from-affiliation'])
+
+
     # calculate the length of an email's content
     def calculate_content_length(self, text):
         try:
@@ -310,13 +231,8 @@ class Extractor():
     # use nltk polarity scoring to compute email content sentiment
     def calculate_content_sentiment(self, text):
         # use nltk's built-in sentiment model to calculate positive, neutral, negative, and compounds scores
-        sentiment = None
-        # if there is no content, skip over. The None value is handled by csv_aggregation.py
-        try:
-            sentiment = self.sia.polarity_scores(text)
-        except:
-            pass
-        return sentiment
+        # if there is no content, the scorer returns None. The None value is handled by csv_aggregation.py
+        return self.sentiment_scorer.score(text)
 
 
 
@@ -324,6 +240,23 @@ class Extractor():
         return 0
 
 
+    # parse a raw date header into a utc timestamp, None if it cannot be parsed
+    def parse_timestamp(self, text):
+        if not isinstance(text, str):
+            return None
+        value = self.timestamps.get(text)
+        if value is None:
+            value = parse_timestamps(pd.Series([text], dtype=object), self.timestamps).iloc[0]
+        if pd.isnull(value):
+            return None
+        return pd.Timestamp(value)
+
+
+    # parse a whole column of raw date headers into utc datetime64 values, memoized
+    def extract_timestamp_column(self, dates):
+        return parse_timestamps(dates, self.timestamps)
+
+
     # extract the domain affiliation of an email
     def extract_affiliation(self, text):
         if isinstance(text, int):
@@ -356,13 +289,395 @@ class Extractor():
         return ""
 
 
+"""
+Topic keyword lexicon used to categorize emails. The keyword files are read once and
+compiled into a single token -> topic lookup table, so categorizing costs one dictionary
+probe per token.
+"""
+class TopicLexicon():
+    # keyword files in the order the topics are checked; a keyword listed under several
+    # topics belongs to the first one
+    topic_files = [('service', 'service.txt'),
+                    ('arts', 'creative-and-performing-arts.txt'),
+                    ('culture', 'culture-and-identity.txt'),
+                    ('politics', 'government-and-politics.txt'),
+                    ('athletics', 'athletics.txt'),
+                    ('preprofessional', 'preprofessional-opportunities.txt')]
+
+    def __init__(self, keywords_path='./content-stopwords/topic-keywords/'):
+        self.token_topics = {}
+        for topic, file_name in self.topic_files:
+            f = open(keywords_path + file_name, 'r')
+            for x in f:
+                self.token_topics.setdefault(x.lower().strip(), topic)
+            f.close()
+        self.punctuation_table = str.maketrans('', '', string.punctuation)
+
+
+    # count keywords in a text, categorize the topic
+    def categorize(self, text):
+        if isinstance(text, float):
+            return 'miscellaneous'
+        topic_wf_dict = defaultdict(lambda: 0)
+        for word in text.lower().split():
+            topic = self.token_topics.get(word.translate(self.punctuation_table))
+            if topic is not None:
+                topic_wf_dict[topic] += 1
+        topic = 'miscellaneous'
+        # use the highest count value to categorize
+        highest_value = 1
+        for key in topic_wf_dict:
+            if topic_wf_dict[key] > highest_value:
+                highest_value = topic_wf_dict[key]
+                topic = key
+        return topic
+
+
+"""
+Multi-lexicon stopword counter. Every lexicon token maps to the lexicons it belongs to
+(with its multiplicity in each file), so all lexicon counts of a text come out of a single
+tokenization pass with one dictionary probe per token. New lexicons are added by name,
+read from <stopwords_path><name>.txt.
+"""
+class StopwordCounter():
+    def __init__(self, lexicons, stopwords, stopwords_path='./content-stopwords/'):
+        self.lexicons = []
+        self.token_lexicons = {}
+        for lexicon in lexicons:
+            f = open(stopwords_path + lexicon + '.txt', 'r')
+            self.add_lexicon(lexicon, [x.strip() for x in f], stopwords)
+            f.close()
+
+
+    # add a lexicon given as a list of tokens
+    def add_lexicon(self, lexicon, tokens, stopwords):
+        index = len(self.lexicons)
+        self.lexicons.append(lexicon)
+        for token in tokens:
+            # english stopwords are removed from texts before counting, so they can never match
+            if token in stopwords:
+                continue
+            weights = self.token_lexicons.setdefault(token, {})
+            weights[index] = weights.get(index, 0) + 1
+
+
+    # count the tokens of each lexicon in a text, returned in the order of self.lexicons
+    def count(self, text):
+        counts = [0] * len(self.lexicons)
+        if not isinstance(text, str):
+            return counts
+        # replace hyphens, tokenize, and keep lowercased alphabetic tokens
+        for word in nltk.word_tokenize(text.replace('-', '')):
+            if word.isalpha():
+                weights = self.token_lexicons.get(word.lower())
+                if weights is not None:
+                    for index, weight in weights.items():
+                        counts[index] += weight
+        return counts
+
+
+"""
+Sentiment scoring service. Texts are keyed by a hash of their content, so the identical
+subjects and announcement bodies that mailing lists repeat are only scored once. Scores
+are kept in a bounded LRU cache and, if a cache path is given, in an sqlite store on disk
+so that re-running aggregation over the same batches skips scoring altogether.
+"""
+class SentimentScorer():
+    def __init__(self, sia=None, max_cache_size=100000, cache_path=None, num_workers=1):
+        self.sia = sia if sia is not None else SentimentIntensityAnalyzer()
+        self.cache = LRUCache(maxsize=max_cache_size)
+        self.num_workers = num_workers
+        # scores waiting to be written to the on-disk store
+        self.pending = []
+        self.store = None
+        if cache_path is not None:
+            # several worker processes may share one store, so wait on each other's writes
+            self.store = sqlite3.connect(cache_path, timeout=600)
+            self.store.execute('CREATE TABLE IF NOT EXISTS sentiments (hash TEXT PRIMARY KEY, '
+                                'neg REAL, neu REAL, pos REAL, compound REAL)')
+            self.store.commit()
+
+
+    # hash a text's content
+    def key(self, text):
+        return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+    # score a single text, None if it cannot be scored (e.g. nan content)
+    def score(self, text):
+        if not isinstance(text, str):
+            return None
+        key = self.key(text)
+        sentiment = self.cache.get(key)
+        if sentiment is None:
+            sentiment = self.lookup([key]).get(key)
+        if sentiment is None:
+            sentiment = polarity_scores(self.sia, text)
+            self.remember(key, sentiment)
+        else:
+            self.cache[key] = sentiment
+        return sentiment
+
+
+    # score a batch of texts, only scoring the unique texts that are not cached yet
+    def score_batch(self, texts):
+        keys = [self.key(text) if isinstance(text, str) else None for text in texts]
+        # deduplicate and drop anything already in memory
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key is not None and key not in missing and key not in self.cache:
+                missing[key] = text
+
+        # check the on-disk store
+        for key, sentiment in self.lookup(list(missing.keys())).items():
+            self.cache[key] = sentiment
+            del missing[key]
+
+        # score whatever is left, in parallel if there are enough texts to be worth it
+        missing_keys = list(missing.keys())
+        missing_texts = list(missing.values())
+        if self.num_workers > 1 and len(missing_texts) > 1000:
+            with multiprocessing.Pool(self.num_workers, initializer=init_sentiment_worker) as pool:
+                sentiments = pool.map(score_text, missing_texts, chunksize=256)
+        else:
+            sentiments = [polarity_scores(self.sia, text) for text in missing_texts]
+        for key, sentiment in zip(missing_keys, sentiments):
+            self.remember(key, sentiment)
+        self.flush()
+
+        return [self.cache.get(key) if key is not None else None for key in keys]
+
+
+    # look up hashed texts in the on-disk store
+    def lookup(self, keys):
+        found = {}
+        if self.store is None:
+            return found
+        # sqlite limits the number of parameters in a query
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self.store.execute('SELECT hash, neg, neu, pos, compound FROM sentiments WHERE hash IN (' +
+                                    ','.join('?' * len(chunk)) + ')', chunk)
+            for key, neg, neu, pos, compound in rows:
+                found[key] = {'neg': neg, 'neu': neu, 'pos': pos, 'compound': compound}
+        return found
+
+
+    # keep a new score in memory and queue it for the on-disk store
+    def remember(self, key, sentiment):
+        self.cache[key] = sentiment
+        if self.store is not None and sentiment is not None:
+            self.pending.append((key, sentiment['neg'], sentiment['neu'], sentiment['pos'], sentiment['compound']))
+            if len(self.pending) >= 1000:
+                self.flush()
+
+
+    # write queued scores to the on-disk store
+    def flush(self):
+        if self.store is None or not self.pending:
+            return
+        self.store.executemany('INSERT OR IGNORE INTO sentiments VALUES (?, ?, ?, ?, ?)', self.pending)
+        self.store.commit()
+        self.pending = []
+
+
+"""
+Individually-indexed table aggregated from parsed emails. Email addresses are interned to dense
+ids, each metric is a typed array indexed by id and club affiliations are one set of
+(id, club) keys, rather than a dictionary of metrics and a set per individual
+"""
+class IndividualTable():
+    sentiment_keys = ['neg', 'neu', 'pos', 'compound']
+    # club affiliation pairs are keyed as id * club_key_base + club id
+    club_key_base = 1 << 32
+
+    def __init__(self):
+        self.ids = {}
+        self.emails = []
+        self.affiliations = []
+        self.num_emails_sent = array('q')
+        self.num_emails_received = array('q')
+        self.num_club_affiliations = array('q')
+        self.avg_sent_content_length = array('d')
+        self.avg_sent_sentiment = {key: array('d') for key in self.sentiment_keys}
+        self.avg_received_sentiment = {key: array('d') for key in self.sentiment_keys}
+        self.club_ids = {}
+        self.club_pairs = set([])
+
+
+    def __len__(self):
+        return len(self.emails)
+
+
+    # id of an email address, adding an empty entry for individuals not seen before
+    def intern(self, email, affiliation):
+        id = self.ids.get(email)
+        if id is None:
+            id = len(self.emails)
+            self.ids[email] = id
+            self.emails.append(email)
+            self.affiliations.append(affiliation)
+            for column in [self.num_emails_sent, self.num_emails_received, self.num_club_affiliations]:
+                column.append(0)
+            self.avg_sent_content_length.append(0.0)
+            for key in self.sentiment_keys:
+                self.avg_sent_sentiment[key].append(0.0)
+                self.avg_received_sentiment[key].append(0.0)
+        return id
+
+
+    # count a club affiliation once per individual
+    def add_club(self, id, club):
+        club_id = self.club_ids.setdefault(club, len(self.club_ids))
+        pair = id * self.club_key_base + club_id
+        if pair not in self.club_pairs:
+            self.club_pairs.add(pair)
+            self.num_club_affiliations[id] += 1
+
+
+    # update an individual's average, rounded at every step, with the newest of count values
+    def update_average(self, averages, id, count, value):
+        averages[id] = round(((count - 1) * averages[id] + value) / count, 4)
+
+
+    # add an email parsed by Extractor.parse, only updating the metrics in columns
+    def add_email(self, extract, columns):
+        # an individual first appearing by emailing themselves only keeps the sending side,
+        # as the sender's new entry used to overwrite the receiver's
+        receiving = extract['to'] != extract['from'] or extract['to'] in self.ids
+        if receiving:
+            to_id = self.intern(extract['to'], extract['to-affiliation'])
+            self.num_emails_received[to_id] += 1
+        from_id = self.intern(extract['from'], extract['from-affiliation'])
+        self.num_emails_sent[from_id] += 1
+
+        if 'num_club_affiliations' in columns and extract['club-affiliation']:
+            if receiving:
+                self.add_club(to_id, extract['club-affiliation'])
+            self.add_club(from_id, extract['club-affiliation'])
+
+        if 'avg_sent_sentiment' in columns or 'avg_received_sentiment' in columns:
+            sentiment = extract['content-sentiment']
+            if sentiment is not None:
+                for key in self.sentiment_keys:
+                    if receiving:
+                        self.update_average(self.avg_received_sentiment[key], to_id, self.num_emails_received[to_id], sentiment[key])
+                    self.update_average(self.avg_sent_sentiment[key], from_id, self.num_emails_sent[from_id], sentiment[key])
+
+        if 'avg_sent_content_length' in columns:
+            self.update_average(self.avg_sent_content_length, from_id, self.num_emails_sent[from_id], extract['content-length'])
+
+
+    # export the table as a dataframe with one row per individual, columns the table does not
+    # aggregate are left empty
+    def to_df(self, columns):
+        out = {}
+        for col in columns:
+            if col in ['email', 'affiliation']:
+                out[col] = self.emails if col == 'email' else self.affiliations
+            elif col in ['num_emails_sent', 'num_emails_received', 'num_club_affiliations', 'avg_sent_content_length']:
+                out[col] = np.array(getattr(self, col))
+            elif col in ['avg_sent_sentiment', 'avg_received_sentiment']:
+                averages = getattr(self, col)
+                out[col] = [dict(zip(self.sentiment_keys, values))
+                            for values in zip(*[averages[key] for key in self.sentiment_keys])]
+            elif col == 'club_affiliations':
+                club_names = list(self.club_ids)
+                clubs = [set([]) for _ in range(len(self.emails))]
+                for pair in self.club_pairs:
+                    clubs[pair // self.club_key_base].add(club_names[pair % self.club_key_base])
+                out[col] = clubs
+            else:
+                out[col] = np.full(len(self.emails), np.nan, dtype=object)
+        return pd.DataFrame(out, columns=columns)
+
+
+# use nltk polarity scoring, None if the text cannot be scored
+def polarity_scores(sia, text):
+    try:
+        return sia.polarity_scores(text)
+    except:
+        return None
+
+
+# sentiment analyzer owned by each worker process of SentimentScorer.score_batch
+worker_sia = None
+
+
+# create the sentiment analyzer of a worker process
+def init_sentiment_worker():
+    global worker_sia
+    worker_sia = SentimentIntensityAnalyzer()
+
+
+# score one text in a worker process
+def score_text(text):
+    return polarity_scores(worker_sia, text)
+
+
+# format of the date header of nearly every email, e.g. 'Tue, 4 Mar 2014 22:01:59 +0000'
+email_date_format = '%a, %d %b %Y %H:%M:%S %z'
+
+
+# parse raw date headers into a timezone-normalized (utc) datetime64 series. Unique headers are
+# parsed vectorized with the known format, only the residual ones fall back to dateutil. If a
+# cache is given, parsed values are looked up and stored by raw header string
+def parse_timestamps(dates, cache=None):
+    dates = pd.Series(dates, dtype=object)
+    codes, uniques = pd.factorize(dates)
+    values = np.full(len(uniques), np.datetime64('NaT'), dtype='datetime64[ns]')
+
+    # look up previously parsed headers
+    missing = []
+    for i, text in enumerate(uniques):
+        value = cache.get(text) if cache is not None else None
+        if value is None:
+            missing.append(i)
+        else:
+            values[i] = value
+
+    if missing:
+        texts = pd.Series([uniques[i] for i in missing], dtype=object)
+        parsed = pd.to_datetime(texts, format=email_date_format, errors='coerce', utc=True)
+        parsed = parsed.dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+        for j, i in enumerate(missing):
+            value = parsed[j]
+            # e.g. trailing '(PST)' or named timezones
+            if np.isnat(value):
+                value = parse_timestamp_fallback(uniques[i])
+            values[i] = value
+            if cache is not None:
+                cache[uniques[i]] = value
+
+    # missing headers have code -1
+    timestamps = np.full(len(dates), np.datetime64('NaT'), dtype='datetime64[ns]')
+    found = codes >= 0
+    timestamps[found] = values[codes[found]]
+    return pd.Series(timestamps, index=dates.index)
+
+
+# parse a date header with dateutil, converted to naive utc, NaT if it cannot be parsed
+def parse_timestamp_fallback(text):
+    try:
+        timestamp = pd.Timestamp(parser.parse(text))
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+        return timestamp.to_datetime64()
+    except:
+        return np.datetime64('NaT')
+
+
+# pattern of an email address within a raw to/from header
+email_address_pattern = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+
+
 # extract an email address from input text 
 def extract_email_address(text):
     # if nan value
     if isinstance(text, float):
         return -1
     # search for email
-    match = re.search(r'[\w.+-]+@[\w-]+\.[\w.-]+', text)
+    match = email_address_pattern.search(text)
     # sometimes undisclosed recipients
     if match is None:
         return text
@@ -0,0 +1,333 @@
+"""
+Persistent per-individual aggregates of the email dataframes. Sums, counts, first/last sent
+timestamps and club affiliation sets are kept instead of averages, so new batches (or new lists
+of an existing batch) can be folded in without re-aggregating every batch, aggregates of separate
+batches can be merged, and the individual dataframe is derived from them at read time
+"""
+import os
+import pickle
+import multiprocessing
+import numpy as np
+import pandas as pd
+from csv_aggregation import email_df_path, full_email_df, finalize_averages
+
+
+topics = ['arts', 'athletics', 'culture', 'misc', 'politics', 'preprofessional', 'service']
+sentiment_columns = ['sub-neg', 'sub-neu', 'sub-pos', 'sub-com', 'con-neg', 'con-neu', 'con-pos', 'con-com']
+wf_columns = ['sub-semitic-wf', 'sub-crypto-wf', 'con-semitic-wf', 'con-crypto-wf']
+
+# timestamp state of an individual: no sent emails yet, a missing timestamp on the first sent
+# email (which sticks, as in index_by_individual), or valid first and last sent timestamps
+never_sent, missing_timestamp, has_timestamp = 0, 1, 2
+
+# club affiliation pairs are keyed as individual * club_key_base + club
+club_key_base = 1 << 32
+
+
+"""
+Sums, counts and first/last timestamps per individual, in order of first appearance. Folding email
+dataframes one after another gives exactly the individual dataframe aggregate_by_individual builds
+from their concatenation: float sums are accumulated in row order with np.add.at
+"""
+class IndividualAggregates():
+    def __init__(self):
+        self.emails = pd.Index([], dtype=object)
+        self.affiliations = np.empty(0, dtype=object)
+        self.counts = {}
+        for direction in ['sent', 'received']:
+            self.counts['num-emails-' + direction] = np.zeros(0, dtype=np.int64)
+            for topic in topics:
+                self.counts['num-' + direction + '-' + topic] = np.zeros(0, dtype=np.int64)
+        self.sums = {'content-length': np.zeros(0)}
+        for col in sentiment_columns:
+            self.sums['sent-' + col] = np.zeros(0)
+            self.sums['received-' + col] = np.zeros(0)
+        for col in wf_columns:
+            self.sums['sent-' + col] = np.zeros(0)
+        # word frequency sums stay integers as long as every folded column was
+        self.integer_wf = {col: True for col in wf_columns}
+        self.timestamp_states = np.zeros(0, dtype=np.int8)
+        self.first_timestamps = np.empty(0, dtype=object)
+        self.last_timestamps = np.empty(0, dtype=object)
+        self.club_names = pd.Index([], dtype=object)
+        self.club_pairs = np.zeros(0, dtype=np.int64)
+        # receiving side of the self-sent emails individuals first appeared in, which is dropped
+        # unless these aggregates are merged onto ones that already know the individual
+        self.pending_codes = np.zeros(0, dtype=np.int64)
+        self.pending_topics = np.zeros(0, dtype=np.int64)
+        self.pending_values = np.zeros((0, len(sentiment_columns)))
+
+
+    def __len__(self):
+        return len(self.emails)
+
+
+    # grow every per-individual array by num_new individuals
+    def extend(self, new_emails, new_affiliations):
+        num_new = len(new_emails)
+        self.emails = self.emails.append(pd.Index(new_emails, dtype=object))
+        self.affiliations = np.concatenate((self.affiliations, new_affiliations))
+        for key in self.counts:
+            self.counts[key] = np.concatenate((self.counts[key], np.zeros(num_new, dtype=np.int64)))
+        for key in self.sums:
+            self.sums[key] = np.concatenate((self.sums[key], np.zeros(num_new)))
+        self.timestamp_states = np.concatenate((self.timestamp_states, np.zeros(num_new, dtype=np.int8)))
+        self.first_timestamps = np.concatenate((self.first_timestamps, np.full(num_new, None, dtype=object)))
+        self.last_timestamps = np.concatenate((self.last_timestamps, np.full(num_new, None, dtype=object)))
+
+
+    # fold an email-indexed dataframe into the aggregates, only touching the individuals in it
+    def fold(self, df):
+        n = len(df)
+        rows = np.arange(n)
+        num_known = len(self.emails)
+
+        # interleave receivers and senders so that new individuals are numbered in the order
+        # index_by_individual would insert them
+        interleaved = np.empty(2 * n, dtype=object)
+        interleaved[0::2] = df['to'].to_numpy(dtype=object)
+        interleaved[1::2] = df['from'].to_numpy(dtype=object)
+        codes = self.emails.get_indexer(interleaved)
+        new = codes < 0
+        new_codes, new_emails = pd.factorize(interleaved[new], use_na_sentinel=False)
+        codes[new] = new_codes + num_known
+        to_codes, from_codes = codes[0::2], codes[1::2]
+
+        # slot each new individual first appears in
+        _, first_new = np.unique(new_codes, return_index=True)
+        first_slot = np.flatnonzero(new)[first_new]
+
+        # when someone emails themselves in the row they first appear in, index_by_individual
+        # overwrites the receiving entry with the sending entry, dropping the receiving side of that row
+        self_first = (to_codes == from_codes) & (to_codes >= num_known)
+        self_first[self_first] = first_slot[to_codes[self_first] - num_known] == 2 * rows[self_first]
+        received = ~self_first
+        first_slot[to_codes[self_first] - num_known] += 1
+
+        # domain affiliation is taken from the row an individual first appears in
+        interleaved_affiliations = np.empty(2 * n, dtype=object)
+        interleaved_affiliations[0::2] = df['to-affiliation'].to_numpy(dtype=object)
+        interleaved_affiliations[1::2] = df['from-affiliation'].to_numpy(dtype=object)
+        self.extend(new_emails, interleaved_affiliations[first_slot])
+        num_people = len(self.emails)
+
+        # numbers of emails sent and received, overall and by topic
+        self.counts['num-emails-sent'] += np.bincount(from_codes, minlength=num_people)
+        self.counts['num-emails-received'] += np.bincount(to_codes[received], minlength=num_people)
+        topic_codes = df['topic'].to_numpy().astype(np.int64)
+        for i, topic in enumerate(topics):
+            is_topic = topic_codes == i
+            self.counts['num-sent-' + topic] += np.bincount(from_codes[is_topic], minlength=num_people)
+            self.counts['num-received-' + topic] += np.bincount(to_codes[received & is_topic], minlength=num_people)
+
+        # sums of sentiments, content length and word frequencies, added in row order
+        for col in sentiment_columns:
+            values = df[col].to_numpy(dtype=np.float64)
+            np.add.at(self.sums['sent-' + col], from_codes, values)
+            np.add.at(self.sums['received-' + col], to_codes[received], values[received])
+        np.add.at(self.sums['content-length'], from_codes, df['content-length'].to_numpy(dtype=np.float64))
+        for col in wf_columns:
+            # full_email_df concatenates onto an empty frame, which leaves object columns behind
+            values = pd.to_numeric(df[col])
+            self.integer_wf[col] = self.integer_wf[col] and values.dtype.kind in 'iu'
+            np.add.at(self.sums['sent-' + col], from_codes, values.to_numpy(dtype=np.float64))
+
+        # distinct club affiliations over sent and received emails
+        club_affiliations = df['affiliation'].to_numpy(dtype=object)
+        club_codes = self.club_names.get_indexer(club_affiliations)
+        new_club_codes, new_clubs = pd.factorize(club_affiliations[club_codes < 0], use_na_sentinel=False)
+        club_codes[club_codes < 0] = new_club_codes + len(self.club_names)
+        self.club_names = self.club_names.append(pd.Index(new_clubs, dtype=object))
+        self.club_pairs = pd.unique(np.concatenate((self.club_pairs,
+                                                    to_codes * club_key_base + club_codes,
+                                                    from_codes * club_key_base + club_codes)))
+
+        self.pending_codes = np.concatenate((self.pending_codes, to_codes[self_first]))
+        self.pending_topics = np.concatenate((self.pending_topics, topic_codes[self_first]))
+        self.pending_values = np.concatenate((self.pending_values, df[sentiment_columns].to_numpy(dtype=np.float64)[self_first]))
+
+        self.fold_timestamps(df['timestamp'].to_numpy(), from_codes)
+        return self
+
+
+    # update first and last sent timestamps of the senders of a dataframe
+    def fold_timestamps(self, timestamps, from_codes):
+        timestamp_codes, values = pd.factorize(timestamps, sort=True)
+        timestamp_codes = pd.Series(timestamp_codes)
+        # individuals sending their first email get the state of its timestamp
+        first_codes = timestamp_codes.groupby(from_codes).first()
+        first_senders = first_codes.index.to_numpy()
+        first_senders = first_senders[self.timestamp_states[first_senders] == never_sent]
+        self.timestamp_states[first_senders] = np.where(first_codes[first_senders] >= 0, has_timestamp, missing_timestamp)
+
+        # extend the bounds of individuals with valid timestamps. They are kept for individuals whose
+        # missing first timestamp sticks too, in case they are merged onto aggregates they sent from before
+        valid = timestamp_codes >= 0
+        bounds = timestamp_codes[valid].groupby(from_codes[valid.to_numpy()]).agg(['min', 'max'])
+        self.extend_bounds(bounds.index.to_numpy(), values[bounds['min'].to_numpy()].astype(object),
+                           values[bounds['max'].to_numpy()].astype(object))
+
+
+    # widen the first and last sent timestamps of individuals to include new ones
+    def extend_bounds(self, people, first, last):
+        had_bounds = np.array([timestamp is not None for timestamp in self.first_timestamps[people]], dtype=bool)
+        update = ~had_bounds
+        update[had_bounds] = first[had_bounds] < self.first_timestamps[people[had_bounds]]
+        self.first_timestamps[people[update]] = first[update]
+        update = ~had_bounds
+        update[had_bounds] = last[had_bounds] > self.last_timestamps[people[had_bounds]]
+        self.last_timestamps[people[update]] = last[update]
+
+
+    # merge the aggregates of later emails into these ones. Merging is associative, so batches can
+    # be aggregated separately and reduced in any tree that keeps their order. The result matches
+    # folding their emails in order, up to the order float sums are added in
+    def merge(self, other):
+        num_known = len(self.emails)
+        codes = self.emails.get_indexer(other.emails)
+        new = codes < 0
+        codes[new] = np.arange(num_known, num_known + new.sum())
+        self.extend(other.emails[new], other.affiliations[new])
+
+        # every individual appears once, so the sums can be added with fancy indexing
+        for key in self.counts:
+            self.counts[key][codes] += other.counts[key]
+        for key in self.sums:
+            self.sums[key][codes] += other.sums[key]
+        for col in wf_columns:
+            self.integer_wf[col] = self.integer_wf[col] and other.integer_wf[col]
+
+        # the receiving side of a self-sent email counts for individuals these aggregates already knew
+        pending_codes = codes[other.pending_codes]
+        known = pending_codes < num_known
+        people, people_topics = pending_codes[known], other.pending_topics[known]
+        self.counts['num-emails-received'][people] += 1
+        for i, topic in enumerate(topics):
+            self.counts['num-received-' + topic][people[people_topics == i]] += 1
+        for i, col in enumerate(sentiment_columns):
+            self.sums['received-' + col][people] += other.pending_values[known, i]
+        self.pending_codes = np.concatenate((self.pending_codes, pending_codes[~known]))
+        self.pending_topics = np.concatenate((self.pending_topics, other.pending_topics[~known]))
+        self.pending_values = np.concatenate((self.pending_values, other.pending_values[~known]))
+
+        # club affiliation pairs, with the other aggregates' clubs renumbered
+        club_codes = self.club_names.get_indexer(other.club_names)
+        new_clubs = club_codes < 0
+        club_codes[new_clubs] = np.arange(len(self.club_names), len(self.club_names) + new_clubs.sum())
+        self.club_names = self.club_names.append(other.club_names[new_clubs])
+        self.club_pairs = pd.unique(np.concatenate((self.club_pairs,
+                                                    codes[other.club_pairs // club_key_base] * club_key_base +
+                                                    club_codes[other.club_pairs % club_key_base])))
+
+        # the state of the first sent timestamp is decided by whichever aggregates saw it first
+        first_senders = self.timestamp_states[codes] == never_sent
+        self.timestamp_states[codes[first_senders]] = other.timestamp_states[first_senders]
+        has_bounds = np.array([timestamp is not None for timestamp in other.first_timestamps], dtype=bool)
+        self.extend_bounds(codes[has_bounds], other.first_timestamps[has_bounds], other.last_timestamps[has_bounds])
+        return self
+
+
+    # derive the individual dataframe, with averages, as aggregate_by_individual returns it
+    def individual_df(self, individual_columns):
+        out = {'email': self.emails.to_numpy(dtype=object), 'affiliation': self.affiliations}
+        num_sent, num_received = self.counts['num-emails-sent'], self.counts['num-emails-received']
+        for key in self.counts:
+            out[key] = self.counts[key]
+        for col in sentiment_columns:
+            out['avg-sent-' + col] = finalize_averages(self.sums['sent-' + col], num_sent)
+            out['avg-received-' + col] = finalize_averages(self.sums['received-' + col], num_received)
+        out['avg-content-length'] = finalize_averages(self.sums['content-length'], num_sent)
+        for col in wf_columns:
+            sums = self.sums['sent-' + col]
+            out['sum-sent-' + col] = sums.astype(np.int64) if self.integer_wf[col] else sums
+        out['num-club-affiliations'] = np.bincount(self.club_pairs // club_key_base, minlength=len(self.emails))
+
+        first_timestamps = np.full(len(self.emails), None, dtype=object)
+        last_timestamps = np.full(len(self.emails), None, dtype=object)
+        first_timestamps[self.timestamp_states == missing_timestamp] = np.nan
+        last_timestamps[self.timestamp_states == missing_timestamp] = np.nan
+        has_bounds = self.timestamp_states == has_timestamp
+        first_timestamps[has_bounds] = self.first_timestamps[has_bounds]
+        last_timestamps[has_bounds] = self.last_timestamps[has_bounds]
+        out['first-email-timestamp'] = first_timestamps
+        out['last-email-timestamp'] = last_timestamps
+
+        return pd.DataFrame({col: out[col] for col in individual_columns})
+
+
+# aggregate a single batch's email dataframe, e.g. in a worker process
+def aggregate_batch(batch_num, email_columns, parent_dir=False):
+    return IndividualAggregates().fold(full_email_df([batch_num], email_columns, parent_dir))
+
+
+# merge aggregates pairwise, level by level, keeping their order
+def merge_tree(aggregates):
+    if not aggregates:
+        return IndividualAggregates()
+    while len(aggregates) > 1:
+        merged = [aggregates[i].merge(aggregates[i + 1]) for i in range(0, len(aggregates) - 1, 2)]
+        if len(aggregates) % 2:
+            merged.append(aggregates[-1])
+        aggregates = merged
+    return aggregates[0]
+
+
+# aggregate batches on separate processes and reduce their aggregates in a tree
+def aggregate_batches(batch_nums, email_columns, parent_dir=False, num_workers=None):
+    with multiprocessing.Pool(num_workers) as pool:
+        aggregates = pool.starmap(aggregate_batch, [(batch_num, email_columns, parent_dir) for batch_num in batch_nums])
+    return merge_tree(aggregates)
+
+
+"""
+Aggregates persisted to disk together with a manifest of the folded batches and lists, in one file
+so that they are always replaced together. Batches are only re-read if their email dataframe changed,
+and then only the emails of lists that were not folded yet are aggregated. This needs the email
+dataframes' 'list-name' column
+"""
+class IndividualAggregateStore():
+    def __init__(self, path='./dataframes/individual_aggregates/'):
+        self.path = path
+        self.aggregates = IndividualAggregates()
+        # batch number -> modification time of its email dataframe when it was folded
+        self.batches = {}
+        self.lists = set([])
+        if os.path.exists(self.path + 'store.pkl'):
+            with open(self.path + 'store.pkl', 'rb') as f:
+                store = pickle.load(f)
+            self.aggregates = store['aggregates']
+            self.batches = store['batches']
+            self.lists = store['lists']
+
+
+    # fold the emails of new batches and new lists into the store, then save it
+    def fold_batches(self, batch_nums, email_columns, parent_dir=False):
+        for batch_num in batch_nums:
+            mtime = os.path.getmtime(email_df_path(batch_num, parent_dir))
+            if self.batches.get(str(batch_num)) == mtime:
+                continue
+            columns = email_columns if 'list-name' in email_columns else email_columns + ['list-name']
+            df = full_email_df([batch_num], columns, parent_dir)
+            list_names = df['list-name'].astype(str)
+            new_emails = ~list_names.isin(self.lists)
+            print("Folding {n} new emails of batch {b}".format(n=int(new_emails.sum()), b=batch_num))
+            if new_emails.any():
+                self.aggregates.fold(df[new_emails.to_numpy()])
+            self.lists.update(list_names[new_emails].unique())
+            self.batches[str(batch_num)] = mtime
+        self.save()
+        return self
+
+
+    # individual dataframe of everything folded so far
+    def individual_df(self, individual_columns):
+        return self.aggregates.individual_df(individual_columns)
+
+
+    # write the aggregates and manifest to a temporary file and replace the store in one step, so an
+    # interrupted save leaves the previous store intact
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.path + 'store.pkl.tmp', 'wb') as f:
+            pickle.dump({'aggregates': self.aggregates, 'batches': self.batches, 'lists': self.lists}, f)
+        os.replace(self.path + 'store.pkl.tmp', self.path + 'store.pkl')
@@ -5,9 +5,10 @@ import os
 import numpy as np
 import pandas as pd
 import csv
-from datetime import datetime
 from tqdm import tqdm
 import re
+import multiprocessing
+from helpers import parse_timestamps
 
 
 # specify batch number here, parsing to be done in batches
@@ -15,14 +16,15 @@ scp_path = './scp-results/batch'
 batch = 3
 archives_path = scp_path + str(batch) + '/'
 
-# find file paths
-batch_dirs = []
-list_dirs = []
-for subdir, dirs, files in os.walk(archives_path):
-    for dir in dirs:
-        batch_dirs.append(dir)
-for batch_dir in batch_dirs:
-    list_dirs.append((archives_path + batch_dir + '/', batch_dir))
+# columns of the decoded batch csv
+decoded_columns = ['list-name', 'id','to-name', 'to-address','from-name','from-address',
+                    'subject','date','content','parent-id', 'datetime-object', 'to', 'from']
+
+# quoted printable escapes, e.g. '=3D'
+quoted_printable_pattern = re.compile('=[0-9A-F]{2}')
+# a header split on spaces into the words before the first word containing '@', that word, and the
+# words after it
+header_pattern = re.compile(r'^(?P<before>(?:[^ ]* )*?)(?P<address>[^ ]*@[^ ]*)(?: (?P<after>.*))?$', re.DOTALL)
 
 
 # decode quoted printable text
@@ -32,105 +34,102 @@ def quoted_printable_decoding(text):
         return text
     # if the email is too short, do not alter it
     if len(text) > 5:
-        text = re.sub('=(0|1|2|3|4|5|6|7|8|9|A|B|C|D|E|F)(0|1|2|3|4|5|6|7|8|9|A|B|C|D|E|F)', '', text)
-        text = re.sub('=', '', text)
+        text = quoted_printable_pattern.sub('', text)
+        text = text.replace('=', '')
     return text
 
 
+# decode quoted printable text of a whole column
+def quoted_printable_decoding_column(texts):
+    # only strings longer than 5 characters are altered
+    long_text = texts.map(lambda text: isinstance(text, str) and len(text) > 5).astype(bool)
+    decoded = texts.copy()
+    decoded[long_text] = texts[long_text].str.replace(quoted_printable_pattern, '', regex=True).str.replace('=', '', regex=False)
+    return decoded
+
+
+# separate names from email addresses in a column of headers. A single word is taken as the address,
+# otherwise the first word containing '@' is the address and the remaining words are the name. Headers
+# that are missing or have no such word get None for both
+def split_header_column(headers):
+    address = pd.Series(None, index=headers.index, dtype=object)
+    name = pd.Series(None, index=headers.index, dtype=object)
+    is_text = headers.map(lambda header: isinstance(header, str)).astype(bool)
+    text = headers[is_text]
+
+    single_word = ~text.str.contains(' ', regex=False)
+    address[single_word[single_word].index] = text[single_word]
+
+    parts = text[~single_word].str.extract(header_pattern)
+    found = parts['address'].notna()
+    parts = parts[found]
+    # rejoin the words before and after the address with single spaces
+    has_after = parts['after'].notna()
+    before = parts['before'].where(has_after, parts['before'].str[:-1])
+    address[parts.index] = parts['address']
+    name[parts.index] = before + parts['after'].fillna('')
+    return address, name
+
+
 # parsing function
 def process_csv(file_path, listname):
     scp_df = pd.read_csv(file_path)
-    # create new df in final form
-    new_df = pd.DataFrame(columns=['list-name', 'id','to-name', 'to-address','from-name','from-address',
-                                    'subject','date','content','parent-id', 'datetime-object', 'to', 'from'])
-
-    # iterate through the scp'd content
-    for index, row in tqdm(scp_df.iterrows()):
-        # reformat date
-        datetime_object = None
-        try:
-            datetime_object = datetime.strptime(row['date'], '%a, %d %b %Y %H:%M:%S %z')
-        except:
-            datetime_object = None
-
-        # try to separate names from email addresses for 'to' column
-        try:
-            to_array = row['to'].split(' ')
-            new_to_address = None
-            new_to_name = None
-            if len(to_array) == 1:
-                new_to_address = to_array[0]
-                new_to_name = None
-            else:
-                for s in to_array:
-                    if '@' in s:
-                        new_to_address = s
-                        break
-                if new_to_address:
-                    to_array.remove(new_to_address)
-                    new_to_name = ' '.join(to_array)
-                # if couldn't find valid email address, keep separated
-                else:
-                    new_to_address, new_to_name = None, None
-        except:
-            new_to_address, new_to_name = None, None
-
-        # try to separate name from address in 'from' column
-        try:
-            from_array = row['from'].split(' ')
-            new_from_address = None
-            new_from_name = None
-            if len(from_array) == 1:
-                new_from_address = from_array[0]
-                new_from_name = None
-            else:
-                for s in from_array:
-                    if '@' in s:
-                        new_from_address = s
-                        break
-                if new_from_address:
-                    from_array.remove(new_from_address)
-                    new_from_name = ' '.join(from_array)
-                # if could not find a valid email address, do not separate
-                else:
-                    new_from_address, new_from_name = None, None
-
-            new_from_address = new_from_address.strip('<>"')
-            new_to_address = new_to_address.strip('<>"')
-        except:
-            new_from_address, new_from_name = None, None
-
-        # remove quoted printable encodings
-        row_content = quoted_printable_decoding(row['content'])
-
-        # if all of these are null, it is likely a blank row in the csv. Skip it
-        if not datetime_object and not new_to_address and not new_to_name and not new_from_address and not new_from_name:
-            continue
-
-        # create new row in new df
-        new_df.loc[len(new_df.index)] = [listname, row['id'], new_to_name, new_to_address,
-                                        new_from_name, new_from_address, row['subject'],
-                                        row['date'], row_content, row['parent-id'],
-                                        datetime_object, row['to'], row['from']]
-
-    return new_df
-
-
-final_df = pd.DataFrame(columns=['list-name','id','to-name', 'to-address','from-name','from-address',
-                                'subject','date','content','parent-id', 'datetime-object', 'to', 'from'])
-# set maximum number of lists to preprocess
-max_dirs = 15
-counter = 0
-
-for path, listname in tqdm(list_dirs):
-    print("processing: " + listname)
-    file_list = os.listdir(path)
-    for file in file_list:
-        df = process_csv(path + file, listname)
-        final_df = pd.concat([final_df, df])
-    counter += 1
-    # set max_dirs to None to process the whole batch
-    if max_dirs and counter > max_dirs:
-        break
-
-final_df.to_csv('./batch-emails/batch' + str(batch) + '.csv')
+
+    to_address, to_name = split_header_column(scp_df['to'])
+    from_address, from_name = split_header_column(scp_df['from'])
+
+    # addresses are stripped of brackets and quotes only if both addresses were found, otherwise
+    # the sender is dropped and the receiver kept as is
+    both_found = to_address.notna() & from_address.notna()
+    to_address[both_found] = to_address[both_found].str.strip('<>"')
+    from_address[both_found] = from_address[both_found].str.strip('<>"')
+    from_address[~both_found] = None
+    from_name[~both_found] = None
+
+    # parse all dates at once, normalized to utc
+    datetime_objects = parse_timestamps(scp_df['date'])
+
+    new_df = pd.DataFrame({'list-name': listname, 'id': scp_df['id'], 'to-name': to_name, 'to-address': to_address,
+                            'from-name': from_name, 'from-address': from_address, 'subject': scp_df['subject'],
+                            'date': scp_df['date'], 'content': quoted_printable_decoding_column(scp_df['content']),
+                            'parent-id': scp_df['parent-id'], 'datetime-object': datetime_objects,
+                            'to': scp_df['to'], 'from': scp_df['from']}, columns=decoded_columns)
+
+    # if all of these are null, it is likely a blank row in the csv. Skip it
+    present = datetime_objects.notna()
+    for col in ['to-address', 'to-name', 'from-address', 'from-name']:
+        present |= new_df[col].map(lambda value: isinstance(value, str) and len(value) > 0).astype(bool)
+    return new_df[present].reset_index(drop=True)
+
+
+# decode every csv of a list directory
+def process_list_dir(list_dir):
+    path, listname = list_dir
+    dfs = [process_csv(path + file, listname) for file in sorted(os.listdir(path))]
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=decoded_columns)
+    return pd.concat(dfs)
+
+
+# worker processes re-import this file, so the batch is only decoded when it is run as a script
+if __name__ == '__main__':
+    # find file paths
+    batch_dirs = []
+    list_dirs = []
+    for subdir, dirs, files in os.walk(archives_path):
+        for dir in dirs:
+            batch_dirs.append(dir)
+    for batch_dir in sorted(batch_dirs):
+        list_dirs.append((archives_path + batch_dir + '/', batch_dir))
+
+    # set maximum number of lists to preprocess, None to process the whole batch
+    max_dirs = 15
+    if max_dirs:
+        list_dirs = list_dirs[:max_dirs + 1]
+
+    # decode list directories in parallel, keeping their order
+    with multiprocessing.Pool() as pool:
+        dfs = list(tqdm(pool.imap(process_list_dir, list_dirs), total=len(list_dirs)))
+
+    final_df = pd.concat(dfs) if dfs else pd.DataFrame(columns=decoded_columns)
+    final_df.to_csv('./batch-emails/batch' + str(batch) + '.csv')
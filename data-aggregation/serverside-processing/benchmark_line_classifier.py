@@ -0,0 +1,119 @@
+"""
+Script to measure per-message parse throughput of reply stripping, parent quote detection and
+the nonsense check over a sample mbox, comparing the per-line re.findall footer rules with the
+compiled line classifier. Prints to the console
+"""
+import os
+import re
+import time
+import random
+import helpers
+from objects import MboxReader
+
+
+# footer rules as strip_response_footer used to apply them, one re.findall per rule and line
+def legacy_strip_response_footer(lines, response=True):
+    new_lines = []
+    for line in lines:
+        if response:
+            line = line[1:]
+            if line and line[0] == ' ':
+                line = line[1:]
+            else:
+                continue
+
+        foot = re.findall("On (Sun|Mon|Tue|Wed|Thu|Fri|Sat|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)", line)
+        if foot:
+            break
+        foot = re.findall(r"On (\d+/\d+/\d+),", line)
+        if foot:
+            break
+        quote = re.findall("Quoting", line)
+        quote_email = re.findall(r"(\w+@\w+\.\w+)", line)
+        if quote and quote_email:
+            break
+        at = re.findall("At", line)
+        date = re.findall(r'(\d+/\d+/\d+)', line)
+        wrote = re.findall('wrote', line)
+        if at and date and wrote:
+            break
+        forwarded_message = re.findall("Begin forwarded message:", line)
+        if forwarded_message:
+            break
+
+        new_lines.append(line)
+    return new_lines
+
+
+# nonsense check as it used to split every line into words
+def legacy_is_this_message_nonsense(msg):
+    for line in msg.split('\n'):
+        for word in line.split(' '):
+            if len(word) > 50:
+                if 'http' not in word and 'www' not in word:
+                    return True
+    return False
+
+
+# write a synthetic mbox of list emails, a share of them replying to and quoting earlier ones
+def write_sample_mbox(path, num_messages, seed=0):
+    rng = random.Random(seed)
+    words = ['hello', 'concert', 'tonight', 'join', 'us', 'please', 'board', 'meeting', 'vote', 'AT',
+             'the', 'club', 'www.harvard.edu', 'dinner', 'Quoting', '3/4/14', 'x' * 60]
+    bodies = []
+    f = open(path, 'w')
+    for i in range(num_messages):
+        lines = [' '.join(rng.choice(words) for _ in range(12)) for _ in range(rng.randint(3, 30))]
+        if bodies and rng.random() < 0.5:
+            lines.append('On Tue, Mar 4, 2014 at 10:01 PM, Alice <alice@college.harvard.edu> wrote:')
+            lines += ['> ' + line for line in rng.choice(bodies[-100:])]
+            lines += ['> _______________________________________________', '> list mailing list']
+        bodies.append(lines)
+        f.write('From alice@college.harvard.edu Tue Mar  4 22:01:59 2014\n')
+        f.write('From: Alice <alice@college.harvard.edu>\nTo: list@lists.hcs.harvard.edu\n')
+        f.write('Subject: message ' + str(i) + '\nDate: Tue, 4 Mar 2014 22:01:59 +0000\n\n')
+        f.write('\n'.join(lines) + '\n\n')
+    f.close()
+
+
+# strip replies, detect the quoted parent and check for nonsense for every message
+def parse_messages(texts):
+    results = []
+    for text in texts:
+        content = helpers.strip_replies(text)
+        results.append((content, helpers.find_carrots(text), helpers.is_this_message_nonsense(content)))
+    return results
+
+
+list_name = 'sample'
+num_messages = 20000
+
+# mbox files live at ./<list>.mbox/<list>.mbox
+if not os.path.exists('./' + list_name + '.mbox/' + list_name + '.mbox'):
+    os.makedirs('./' + list_name + '.mbox', exist_ok=True)
+    write_sample_mbox('./' + list_name + '.mbox/' + list_name + '.mbox', num_messages)
+
+with MboxReader('./' + list_name + '.mbox') as mbox:
+    texts = [helpers.remove_r(helpers.get_text(message)) for message in mbox if not isinstance(message, int)]
+print("Parsing " + str(len(texts)) + " messages.")
+
+# compiled line classifier
+s = time.time()
+after_results = parse_messages(texts)
+after = len(texts) / (time.time() - s)
+
+# per-line re.findall rules
+compiled_strip_response_footer = helpers.strip_response_footer
+compiled_is_this_message_nonsense = helpers.is_this_message_nonsense
+helpers.strip_response_footer = legacy_strip_response_footer
+helpers.is_this_message_nonsense = legacy_is_this_message_nonsense
+s = time.time()
+before_results = parse_messages(texts)
+before = len(texts) / (time.time() - s)
+helpers.strip_response_footer = compiled_strip_response_footer
+helpers.is_this_message_nonsense = compiled_is_this_message_nonsense
+
+assert before_results == after_results
+print("Per-line re.findall rules: " + str(round(before, 2)) + " messages per second.")
+print("Compiled line classifier: " + str(round(after, 2)) + " messages per second.")
+print("Speedup: " + str(round(after / before, 2)) + "x")
@@ -14,3 +14,8 @@ class Constants():
 
     email_length_csv_path = 'metadata/num_emails.csv'
     email_length_columns = ['list-name', 'num-emails', 'num-failed-parses']
+
+    failed_lists_csv_path = 'metadata/failed_lists.csv'
+    failed_lists_columns = ['list-name', 'error']
+
+    checkpoints_path = 'metadata/checkpoints/'
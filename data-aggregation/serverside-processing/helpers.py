@@ -6,18 +6,42 @@ import os
 from tqdm import tqdm
 import csv
 import pprint
+import json
+import pickle
 from constants import Constants
 from objects import MessageObject
 
 
+# a line ends the message if it matches one of these footers: "On Mon, ...", "On 1/2/03, ..."
+# or a forwarded message
+footer_pattern = re.compile(r'On (?:Sun|Mon|Tue|Wed|Thu|Fri|Sat|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec|\d+/\d+/\d+,)'
+                            r'|Begin forwarded message:')
+email_pattern = re.compile(r'\w+@\w+\.\w+')
+date_pattern = re.compile(r'\d+/\d+/\d+')
+# words are separated by spaces and line breaks. Arbitrarily chosen threshold to determine when
+# an email is full of nonsense
+long_word_pattern = re.compile(r'[^ \n]{51,}')
+
+
 def is_this_message_nonsense(msg):
-    for line in msg.split('\n'):
-        for word in line.split(' '):
-            # arbitrarily chosen threshold to determine when an email is full of nonsense
-            if len(word) > 50:
-                # a long word may be a link, so use this check. May not cover all cases but will cover most
-                if 'http' not in word and 'www' not in word:
-                    return True
+    for match in long_word_pattern.finditer(msg):
+        word = match.group(0)
+        # a long word may be a link, so use this check. May not cover all cases but will cover most
+        if 'http' not in word and 'www' not in word:
+            return True
+    return False
+
+
+# check if a line begins a footer, quoting header, or forwarded message
+def is_footer_line(line):
+    if footer_pattern.search(line):
+        return True
+    # remove quoting footers
+    if 'Quoting' in line and email_pattern.search(line):
+        return True
+    # remove "At 1/2/03 ... wrote" footers
+    if 'At' in line and 'wrote' in line and date_pattern.search(line):
+        return True
     return False
 
 
@@ -90,37 +114,9 @@ def strip_response_footer(lines, response=True):
             else:
                 continue
 
-        # if we find footers of this form, end the message
-        foot = []
-        foot = re.findall("On (Sun|Mon|Tue|Wed|Thu|Fri|Sat|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)", line)
-        if foot:
-            break
-
-        # check to make sure this isn't removing too many actual email lines
-        foot = re.findall("On (\d+/\d+/\d+),", line)
-        if foot:
-            break
-
-        # remove quoting footers
-        quote = []
-        quote_email = []
-        quote = re.findall("Quoting", line)
-        quote_email = re.findall("(\w+@\w+\.\w+)", line)
-        if quote and quote_email:
-            break
-
-        # remove this type of footer
-        at = re.findall("At", line)
-        date = re.findall('(\d+/\d+/\d+)', line)
-        wrote = re.findall('wrote', line)
-        if at and date and wrote:
-            break
-
-
-        # remove the forwarded message.
-        # this may be interesting to examine in the future, if forwarded messages in a group are unusual
-        forwarded_message = re.findall("Begin forwarded message:", line)
-        if forwarded_message:
+        # if we find footers, quoting or forwarded messages, end the message
+        # forwarded messages may be interesting to examine in the future, if they are unusual in a group
+        if is_footer_line(line):
             break
 
         new_lines.append(line)
@@ -195,6 +191,16 @@ def write_emails(list_name, message_objects, write_num, batch_num):
         print("I/O error")
 
 
+# remove the csv and parquet chunk files already written for a list, e.g. by a run that is restarted
+def remove_emails(list_name, batch_num):
+    list_dir = 'parsed-archives/batch' + str(batch_num) + '/' + list_name + '/'
+    if not os.path.isdir(list_dir):
+        return
+    for file_name in os.listdir(list_dir):
+        if file_name.startswith(list_name + '__') and file_name.endswith(('.csv', '.parquet')):
+            os.remove(list_dir + file_name)
+
+
 def write_num_emails(list_name, num_emails, failures):
     csv_file = Constants.email_length_csv_path
     try:
@@ -203,3 +209,66 @@ def write_num_emails(list_name, num_emails, failures):
             writer.writerow({'list-name': list_name, 'num-emails': num_emails, 'num-failed-parses': failures})
     except IOError:
         print("I/O error")
+
+
+def write_failed_list(list_name, error):
+    csv_file = Constants.failed_lists_csv_path
+    try:
+        with open(csv_file, 'a') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=Constants.failed_lists_columns)
+            writer.writerow({'list-name': list_name, 'error': error})
+    except IOError:
+        print("I/O error")
+
+
+# paths of a list's checkpoint manifest and of the append-only log of its reply index
+def checkpoint_paths(list_name, batch_num):
+    checkpoint_dir = Constants.checkpoints_path + 'batch' + str(batch_num) + '/'
+    return checkpoint_dir + list_name + '.json', checkpoint_dir + list_name + '.reply-index.log'
+
+
+# read a list's checkpoint manifest, None if the list has no checkpoint
+def read_checkpoint(list_name, batch_num):
+    manifest_path, _ = checkpoint_paths(list_name, batch_num)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+# rebuild a list's reply index as of its checkpoint by replaying the logged entries into reply_index
+def read_reply_index(list_name, batch_num, checkpoint, reply_index):
+    _, log_path = checkpoint_paths(list_name, batch_num)
+    with open(log_path, 'rb') as f:
+        # anything past the logged size was appended by a checkpoint that never completed
+        while f.tell() < checkpoint['reply-index-log-size']:
+            reply_index.replay(pickle.load(f))
+    reply_index.lookups, reply_index.exact_matches, reply_index.fuzzy_matches = checkpoint['reply-index-counts']
+    return reply_index
+
+
+# write a list's checkpoint manifest. Only the reply index entries added since the previous checkpoint
+# are appended to its log, after cutting the log back to the size that checkpoint recorded, and the
+# manifest with the new size is replaced atomically last, so a crash at any point leaves a consistent
+# checkpoint behind. A checkpoint at the first message starts a new log
+def write_checkpoint(list_name, batch_num, checkpoint, reply_index):
+    manifest_path, log_path = checkpoint_paths(list_name, batch_num)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    log_size = 0
+    if checkpoint['next-message'] > 0 and os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            log_size = json.load(f)['reply-index-log-size']
+
+    with open(log_path, 'r+b' if os.path.exists(log_path) else 'w+b') as f:
+        f.truncate(log_size)
+        f.seek(log_size)
+        entries = reply_index.drain_journal()
+        if entries:
+            pickle.dump(entries, f)
+        log_size = f.tell()
+    checkpoint = dict(checkpoint, **{'list-name': list_name, 'reply-index-log-size': log_size,
+                                     'reply-index-counts': [reply_index.lookups, reply_index.exact_matches,
+                                                            reply_index.fuzzy_matches]})
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
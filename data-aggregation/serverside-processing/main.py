@@ -2,21 +2,29 @@
 Main script to run on the Mailman server to batch together emails from individual text files on disk,
 and to prepare for scp'ing.
 """
-from objects import MboxReader
+from objects import MboxReader, ReplyIndex, ParquetEmailWriter
 from helpers import *
 import os
 from tqdm import tqdm
-import pprint
 from constants import Constants
-import sys
 import time
+import traceback
+import multiprocessing
+import concurrent.futures
 
 
-def main(list_name, parsed_archives_root_path, batch_num):
+# preprocess one list, returning its number of emails and failed parses. Returns None if the list
+# has no mbox file or was already preprocessed. Progress is checkpointed after every written chunk,
+# so an interrupted list resumes from its last checkpoint. Emails are written in chunks of chunk_size,
+# either to a csv file per chunk or, with output_format='parquet', as row groups of parquet files holding
+# row_groups_per_file chunks each. A parquet list is checkpointed whenever one of its files is finished.
+# Replies are linked through the bodies of the reply_index_size most recent emails of the list (None keeps
+# them all), so a reply quoting an email older than that gets no parent id
+def main(list_name, parsed_archives_root_path, batch_num, show_progress=True, output_format='csv', chunk_size=1000,
+         row_groups_per_file=10, reply_index_size=100000):
     num_emails = 0
     writes = 0
     failures = 0
-    pp = pprint.PrettyPrinter(indent=4)
     print("*"*20 + " Preprocessing beginning for list " + list_name + "... " + "*"*20)
     # some lists do not have an mbox file, just return
     if not os.path.exists('./' + list_name + '.mbox/' + list_name + '.mbox'):
@@ -25,20 +33,51 @@ def main(list_name, parsed_archives_root_path, batch_num):
 
     start = time.time()
 
+    list_path = parsed_archives_root_path + 'batch' + str(batch_num) + '/' + list_name
+    checkpoint = read_checkpoint(list_name, batch_num)
+    if checkpoint is not None and checkpoint['complete']:
+        print("*"*20 + " Preprocessing has already been completed for list " + list_name + "... " + "*"*20)
+        return
+    if checkpoint is None and os.path.exists(list_path):
+        # lists preprocessed before checkpoints were kept have a directory but no checkpoint
+        print("*"*20 + " Preprocessing has already been completed for list " + list_name + "... " + "*"*20)
+        return
+
     with MboxReader('./' + list_name + '.mbox') as mbox:
-        if not os.path.exists(parsed_archives_root_path + 'batch' + str(batch_num) + '/' + list_name):
-            # If it doesn't exist, create it
-            os.makedirs(parsed_archives_root_path + 'batch' + str(batch_num) + '/' + list_name)
-        else:
-            # assume that if the path is there, the preprocessing has already been done
-            print("*"*20 + " Preprocessing has already been completed for list " + list_name + "... " + "*"*20)
-            return
+        next_message = 0
+        # resume from the checkpoint if the mbox has not changed underneath it
+        if checkpoint is not None:
+            if checkpoint['mbox-size'] == mbox.size and checkpoint.get('mbox-mtime') == mbox.mtime and \
+                    checkpoint['mbox-offset'] == message_offset(mbox, checkpoint['next-message']) and \
+                    checkpoint.get('output-format', 'csv') == output_format:
+                next_message = checkpoint['next-message']
+                writes = checkpoint['num-chunks']
+                num_emails = checkpoint['num-emails']
+                failures = checkpoint['num-failed-parses']
+                reply_index = read_reply_index(list_name, batch_num, checkpoint, ReplyIndex(max_size=reply_index_size))
+                print("*"*20 + " Resuming list " + list_name + " at message " + str(next_message) + "... " + "*"*20)
+            else:
+                print("*"*20 + " Mbox or output format of list " + list_name + " changed since its checkpoint, restarting... " + "*"*20)
+        if next_message == 0:
+            reply_index = ReplyIndex(max_size=reply_index_size)
+            # checkpoint before creating the directory, so a directory without a checkpoint is always complete
+            write_checkpoint(list_name, batch_num, new_checkpoint(mbox, 0, writes, num_emails, failures, output_format),
+                             reply_index)
+            # drop the chunks of a discarded checkpoint, so no email is written twice
+            remove_emails(list_name, batch_num)
+            os.makedirs(list_path, exist_ok=True)
 
-        counter = 0
+        counter = num_emails
         messages = []
-        messages_content_set = {}
+        # parquet files are only readable once closed, so a resumed list rewrites its unfinished file
+        parquet_writer = None
+        if output_format == 'parquet':
+            parquet_writer = ParquetEmailWriter('parsed-archives/batch' + str(batch_num) + '/' + list_name + '/' + list_name,
+                                                Constants.email_csv_columns, row_groups_per_file=row_groups_per_file,
+                                                num_files=writes)
 
-        for message in tqdm(mbox, total=mbox.length):
+        for i, message in enumerate(tqdm(mbox.iter_messages(next_message), total=mbox.length, initial=next_message,
+                                         disable=not show_progress), start=next_message):
 
             if isinstance(message, int):
                 print('could not parse message')
@@ -50,9 +89,8 @@ def main(list_name, parsed_archives_root_path, batch_num):
             previous_email_in_chain = find_carrots(text)
             previous_email_in_chain = quoted_printable_decoding(previous_email_in_chain)
 
-            if previous_email_in_chain in messages_content_set:
-                # set parent id of this message to the id of the message it's responding to
-                parent_id = messages_content_set[previous_email_in_chain]['id']
+            # set parent id of this message to the id of the message it's responding to
+            parent_id = reply_index.find(previous_email_in_chain)
 
             try:
                 message_object = process_email(message)
@@ -70,40 +108,158 @@ def main(list_name, parsed_archives_root_path, batch_num):
             message_object.parent_id = parent_id
 
             # decode message from quoted printing before appending to dictionary
-            messages_content_set[quoted_printable_decoding(message_object.content.replace('\n', '').replace(' ', ''))] = {'id': message_object.id}
+            reply_index.add(quoted_printable_decoding(message_object.content.replace('\n', '').replace(' ', '')), message_object.id)
 
             messages.append(message_object)
             counter += 1
             num_emails += 1
-            if counter % 1000 == 0:
-                write_emails(list_name, messages, writes, batch_num)
-                writes += 1
+            if counter % chunk_size == 0:
+                # checkpoint once the chunk is on disk: its own csv file, or a closed parquet file
+                if parquet_writer is None:
+                    write_emails(list_name, messages, writes, batch_num)
+                    writes += 1
+                    written = True
+                else:
+                    written = parquet_writer.write(messages)
+                    writes = parquet_writer.num_files
                 messages = []
+                if written:
+                    write_checkpoint(list_name, batch_num,
+                                     new_checkpoint(mbox, i + 1, writes, num_emails, failures, output_format), reply_index)
 
+        # call write_emails() at the end to ensure the last num_emails%chunk_size messages are written
+        if parquet_writer is None:
+            write_emails(list_name, messages, writes, batch_num)
+            writes += 1
+        else:
+            parquet_writer.write(messages)
+            parquet_writer.close()
+            writes = parquet_writer.num_files
+        write_checkpoint(list_name, batch_num,
+                         new_checkpoint(mbox, len(mbox), writes, num_emails, failures, output_format, True), reply_index)
 
-    # call write_emails() at the end to ensure the last num_emails%1000 messages are written
-    write_emails(list_name, messages, writes, batch_num)
     end = time.time()
     print('Total number of emails in list: ' + str(mbox.length))
     print('Seconds elapsed to preprocess: ' + str(round(end - start, 3)))
-    print('Size of message content dictionary: ' + str(sys.getsizeof(messages_content_set)))
+    print('Reply matches: ' + str(reply_index.match_rates()))
+
+    return mbox.length, failures
+
+
+# byte offset in the mbox where the next_message-th message begins
+def message_offset(mbox, next_message):
+    if next_message == 0:
+        return 0
+    if next_message > len(mbox):
+        return -1
+    return mbox.ends[next_message - 1]
+
 
+# checkpoint of a list, next_message is the first mbox message that is not yet in a written chunk
+# and num_chunks the number of written csv or parquet files
+def new_checkpoint(mbox, next_message, num_chunks, num_emails, failures, output_format='csv', complete=False):
+    return {'mbox-size': mbox.size, 'mbox-mtime': mbox.mtime, 'mbox-offset': message_offset(mbox, next_message), 'next-message': next_message,
+            'num-chunks': num_chunks, 'num-emails': num_emails, 'num-failed-parses': failures,
+            'output-format': output_format, 'complete': complete}
 
-    write_num_emails(list_name, mbox.length, failures)
 
+# run main() for one list. Exceptions are caught so that a failing list does not abort the batch,
+# a failed list resumes from its last checkpoint on the next run
+def run_list(list_name, parsed_archives_root_path, batch_num, show_progress=False, output_format='csv',
+             chunk_size=1000, row_groups_per_file=10, reply_index_size=100000):
+    start = time.time()
+    try:
+        counts = main(list_name, parsed_archives_root_path, batch_num, show_progress=show_progress,
+                      output_format=output_format, chunk_size=chunk_size, row_groups_per_file=row_groups_per_file,
+                      reply_index_size=reply_index_size)
+        return list_name, counts, None, time.time() - start
+    except Exception:
+        return list_name, None, traceback.format_exc(), time.time() - start
+
+
+# preprocess the lists of a batch with num_workers processes (all cores by default), only this
+# process writes to metadata/num_emails.csv. Every list runs in a single-use pool of its own, so its
+# process and reply index are released when it finishes, and a worker that dies (e.g. killed for
+# running out of memory) only breaks its own pool: that list is reported as failed and the others go on
+def run_batch(list_names, parsed_archives_root_path, batch_num, num_workers=None, output_format='csv',
+              chunk_size=1000, row_groups_per_file=10, reply_index_size=100000):
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    failed_lists = []
+    analyzed_list_count = 0
+
+    # report a finished list and record its counts
+    def report(result):
+        nonlocal analyzed_list_count
+        list_name, counts, error, seconds = result
+        analyzed_list_count += 1
+        if error is not None:
+            print("*"*20 + " List " + list_name + " failed: " + "*"*20)
+            print(error)
+            failed_lists.append(list_name)
+            write_failed_list(list_name, error.strip().split('\n')[-1])
+        elif counts is not None:
+            write_num_emails(list_name, counts[0], counts[1])
+        print("Analyzed " + str(analyzed_list_count) + " out of " + str(len(list_names)) + " lists in this batch (" +
+              list_name + ", " + str(round(seconds, 3)) + " seconds)")
+
+    if num_workers <= 1:
+        for list_name in list_names:
+            report(run_list(list_name, parsed_archives_root_path, batch_num, show_progress=True, output_format=output_format,
+                            chunk_size=chunk_size, row_groups_per_file=row_groups_per_file,
+                            reply_index_size=reply_index_size))
+        return failed_lists
+
+    # workers are spawned rather than forked from this process, which runs the other lists' pool threads
+    context = multiprocessing.get_context('spawn')
+    # future -> (list name, its pool, time it was started)
+    in_flight = {}
+    position = 0
+    while in_flight or position < len(list_names):
+        # start lists until num_workers are running
+        while position < len(list_names) and len(in_flight) < num_workers:
+            executor = concurrent.futures.ProcessPoolExecutor(1, mp_context=context)
+            future = executor.submit(run_list, list_names[position], parsed_archives_root_path, batch_num,
+                                     False, output_format, chunk_size, row_groups_per_file, reply_index_size)
+            in_flight[future] = (list_names[position], executor, time.time())
+            position += 1
+
+        # wait for a list to finish before starting more
+        done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            list_name, executor, started = in_flight.pop(future)
+            try:
+                result = future.result()
+            except Exception:
+                # a BrokenProcessPool if the worker died
+                result = (list_name, None, traceback.format_exc(), time.time() - started)
+            executor.shutdown()
+            report(result)
+
+    return failed_lists
 
-batch_num = '2'
-batch_path = './list-batches/' + str(batch_num) + '.txt'
-parsed_archives_root_path = '../../parsed-archives/'
-f = open(batch_path, 'r')
-analyzed_list_count = 0
-for line in f:
-    if line == '\n':
-        break
-    main(line[:-1], parsed_archives_root_path, batch_num)
-    analyzed_list_count += 1
-    print()
-    print("Analyzed " + str(analyzed_list_count) " out of 500 lists in this batch")
 
+# worker processes re-import this file, so the batch only runs when it is executed as a script
+if __name__ == '__main__':
+    batch_num = '2'
+    batch_path = './list-batches/' + str(batch_num) + '.txt'
+    parsed_archives_root_path = '../../parsed-archives/'
+    # 'csv' writes a file per chunk_size emails, 'parquet' a compressed file per row_groups_per_file chunks
+    output_format = 'csv'
+    chunk_size = 1000
+    row_groups_per_file = 10
+    # emails kept per list for linking replies, bounding memory on the largest lists. Replies quoting
+    # an email more than this many emails back get no parent id, None keeps every email
+    reply_index_size = 100000
+    list_names = []
+    f = open(batch_path, 'r')
+    for line in f:
+        if line == '\n':
+            break
+        list_names.append(line[:-1])
+    f.close()
 
-f.close()
+    failed_lists = run_batch(list_names, parsed_archives_root_path, batch_num, output_format=output_format,
+                             chunk_size=chunk_size, row_groups_per_file=row_groups_per_file,
+                             reply_index_size=reply_index_size)
+    print("Failed lists: " + str(failed_lists))
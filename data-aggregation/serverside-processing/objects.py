@@ -1,59 +1,282 @@
 """
 MBox objects for serverside processing.
 """
+import os
+import mmap
 import email
+import random
+import hashlib
+from array import array
 from email.policy import default
 
 
+"""
+Reader over an mbox file backed by a persisted message index. The file is memory-mapped and
+scanned once for the byte offsets of every message, which are saved to <mbox>.index and reused
+as long as the mbox is unchanged. Messages can be accessed randomly (mbox[i], mbox[i:j]) or
+streamed over a range, so parsing can be split across processes or resumed without rescanning.
+Entry 0 is the text before the first 'From ' line (usually empty), kept so that message ids
+match the original line-by-line reader.
+"""
 class MboxReader:
     def __init__(self, filename):
         self.filename = filename + '/' + filename
-        self.length = self.calculate_length()
+        self.index_filename = self.filename + '.index'
         self.handle = open(self.filename, 'rb')
+        self.size = os.fstat(self.handle.fileno()).st_size
+        self.mtime = os.fstat(self.handle.fileno()).st_mtime_ns
+        # empty files cannot be memory-mapped
+        self.data = b''
+        if self.size > 0:
+            self.data = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self.starts, self.ends = self.load_index()
+        # number of emails in this mbox file for tqdm
+        self.length = len(self.starts) - 1
         # sometimes the first line of an mbox file begins with a line break
         # assert first_line.startswith(b'From ') or first_line.startswith('\n')
 
-    # calculate number of emails in this mbox file for tqdm
-    def calculate_length(self):
-        self.handle = open(self.filename, 'rb')
-        length = 0
-        while True:
-            line = self.handle.readline()
-            if line == b'' or line.startswith(b'From '):
-                if line == b'':
-                    break
-                length += 1
-                lines = []
-                continue
-        self.exit()
-        return length
+    # load the persisted index if it matches this mbox file, otherwise scan and persist it
+    def load_index(self):
+        mtime = self.mtime
+        if os.path.exists(self.index_filename):
+            index = array('q')
+            with open(self.index_filename, 'rb') as f:
+                index.frombytes(f.read())
+            # header is the mbox size and modification time the index was built for
+            if len(index) >= 2 and index[0] == self.size and index[1] == mtime:
+                num_messages = (len(index) - 2) // 2
+                return index[2:2 + num_messages], index[2 + num_messages:]
+
+        starts, ends = self.calculate_offsets()
+        try:
+            with open(self.index_filename, 'wb') as f:
+                array('q', [self.size, mtime]).tofile(f)
+                starts.tofile(f)
+                ends.tofile(f)
+        except IOError:
+            print("I/O error")
+        return starts, ends
+
+    # scan the mbox once for the byte range of each message, excluding its 'From ' line
+    def calculate_offsets(self):
+        starts, ends = array('q', [0]), array('q')
+        position = 0 if self.data[:5] == b'From ' else self.data.find(b'\nFrom ')
+        while position != -1:
+            # the 'From ' line itself starts after the line break
+            if self.data[position:position + 1] == b'\n':
+                position += 1
+            ends.append(position)
+            line_end = self.data.find(b'\n', position)
+            starts.append(self.size if line_end == -1 else line_end + 1)
+            position = self.data.find(b'\nFrom ', position)
+        ends.append(self.size)
+        return starts, ends
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        self.handle.close()
+        self.exit()
 
     def exit(self):
+        if self.size > 0:
+            self.data.close()
         self.handle.close()
 
+    def __len__(self):
+        return len(self.starts)
+
+    # raw bytes of the i-th message
+    def message_bytes(self, i):
+        return self.data[self.starts[i]:self.ends[i]]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self.iter_messages(*i.indices(len(self))[:2]))
+        if i < 0:
+            i += len(self)
+        try:
+            return email.message_from_bytes(self.message_bytes(i), policy=default)
+        except:
+            return -1
+
+    # parse messages start to stop, -1 for messages that cannot be parsed
+    def iter_messages(self, start=0, stop=None):
+        if stop is None or stop > len(self):
+            stop = len(self)
+        for i in range(start, stop):
+            yield self[i]
+
     def __iter__(self):
-        return iter(self.__next__())
-
-    def __next__(self):
-        lines = []
-        while True:
-            line = self.handle.readline()
-            if line == b'' or line.startswith(b'From '):
-                try:
-                    yield email.message_from_bytes(b''.join(lines), policy=default)
-                except:
-                    yield -1
-                if line == b'':
-                    break
-                lines = []
-                continue
-            lines.append(line)
+        return self.iter_messages()
+
+
+"""
+Fingerprint index used to link replies to the emails they quote. Normalized email bodies are
+stored as 64-bit hashes instead of whole strings. All emails of a list are kept by default, which
+links the same parents as matching whole strings. With max_size set, only the max_size most recent
+emails are kept, so replies quoting an evicted email get no parent. With fuzzy=True, shingled MinHash
+signatures bucketed by LSH bands also catch quotes that are near-duplicates of an earlier email.
+Lookups and matches are counted for reporting. Entries added since the last drain_journal() are kept
+in a journal, so a checkpoint only needs to save those and replay() rebuilds the index from them.
+"""
+class ReplyIndex:
+    # modulus of the MinHash permutations, the Mersenne prime 2^61 - 1
+    prime = (1 << 61) - 1
+
+    def __init__(self, max_size=None, fuzzy=False, num_permutations=32, num_bands=8, shingle_size=5,
+                 threshold=0.8, seed=0):
+        self.max_size = max_size
+        # fingerprint -> id of the most recent email with that body
+        self.fingerprints = {}
+        self.fuzzy = fuzzy
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.rows_per_band = num_permutations // num_bands
+        generator = random.Random(seed)
+        self.permutations = [(generator.randrange(1, self.prime), generator.randrange(0, self.prime))
+                             for _ in range(num_permutations)]
+        # email id -> MinHash signature, and (band, band signature) -> email ids
+        self.signatures = {}
+        self.buckets = {}
+        self.lookups = 0
+        self.exact_matches = 0
+        self.fuzzy_matches = 0
+        # (fingerprint, id, signature) of the emails added since the journal was last drained
+        self.journal = []
+
+    # 64-bit hash of a normalized text
+    def fingerprint(self, text):
+        return int.from_bytes(hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+
+    # MinHash signature of a text's character shingles
+    def signature(self, text):
+        k = self.shingle_size
+        hashes = [self.fingerprint(text[i:i + k]) for i in range(max(len(text) - k + 1, 1))]
+        return tuple(min((a * h + b) % self.prime for h in hashes) for a, b in self.permutations)
+
+    # band keys of a signature for LSH bucketing
+    def bands(self, signature):
+        r = self.rows_per_band
+        return [(i, signature[i * r:(i + 1) * r]) for i in range(len(signature) // r)]
+
+    # index an email body under its id
+    def add(self, text, id):
+        fingerprint = self.fingerprint(text)
+        signature = self.signature(text) if self.fuzzy else None
+        self.insert(fingerprint, id, signature)
+        self.journal.append((fingerprint, id, signature))
+
+    # index a fingerprint and, with fuzzy=True, a signature under an email id
+    def insert(self, fingerprint, id, signature):
+        # re-insert so that the most recent email with this body wins and is evicted last
+        self.fingerprints.pop(fingerprint, None)
+        self.fingerprints[fingerprint] = id
+        if self.max_size is not None and len(self.fingerprints) > self.max_size:
+            del self.fingerprints[next(iter(self.fingerprints))]
+
+        if signature is not None:
+            self.signatures[id] = signature
+            for band in self.bands(signature):
+                self.buckets.setdefault(band, []).append(id)
+            if self.max_size is not None and len(self.signatures) > self.max_size:
+                evicted = next(iter(self.signatures))
+                for band in self.bands(self.signatures.pop(evicted)):
+                    self.buckets[band].remove(evicted)
+                    if not self.buckets[band]:
+                        del self.buckets[band]
+
+    # return the journal of entries added since the last call, and start a new one
+    def drain_journal(self):
+        journal, self.journal = self.journal, []
+        return journal
+
+    # re-insert drained journal entries in order, giving the index they were drained from
+    def replay(self, entries):
+        for fingerprint, id, signature in entries:
+            self.insert(fingerprint, id, signature)
+
+    # find the id of the email a quoted text comes from, None if there is no match. The quoted text
+    # is -1 when an email does not quote a previous one
+    def find(self, text):
+        if isinstance(text, int):
+            return None
+        self.lookups += 1
+        id = self.fingerprints.get(self.fingerprint(text))
+        if id is not None:
+            self.exact_matches += 1
+            return id
+        if not self.fuzzy:
+            return None
+
+        # compare against every email sharing a band, keeping the most similar (latest on ties)
+        signature = self.signature(text)
+        best_id, best_similarity = None, self.threshold
+        for band in self.bands(signature):
+            for candidate in self.buckets.get(band, []):
+                candidate_signature = self.signatures[candidate]
+                similarity = sum(x == y for x, y in zip(signature, candidate_signature)) / len(signature)
+                if similarity >= best_similarity:
+                    best_id, best_similarity = candidate, similarity
+        if best_id is not None:
+            self.fuzzy_matches += 1
+        return best_id
+
+    # fraction of quoted texts matched to an earlier email
+    def match_rates(self):
+        lookups = max(self.lookups, 1)
+        return {'quoted-emails': self.lookups,
+                'exact-match-rate': round(self.exact_matches / lookups, 4),
+                'fuzzy-match-rate': round(self.fuzzy_matches / lookups, 4)}
+
+
+"""
+Writer appending chunks of emails as row groups of compressed parquet files, starting a new file
+every row_groups_per_file chunks. A file is only readable once closed, so write() reports when a
+file was finished and a list can only be checkpointed then. pyarrow is imported here so that csv output
+does not depend on it.
+"""
+class ParquetEmailWriter:
+    def __init__(self, path_prefix, columns, row_groups_per_file=10, compression='zstd', num_files=0):
+        import pyarrow as pa
+        self.path_prefix = path_prefix
+        self.columns = columns
+        self.row_groups_per_file = row_groups_per_file
+        self.compression = compression
+        self.schema = pa.schema([(col, pa.string()) for col in columns])
+        self.writer = None
+        self.num_row_groups = 0
+        self.num_files = num_files
+
+    # path of the file currently written to
+    def path(self):
+        return self.path_prefix + '__' + str(self.num_files) + '.parquet'
+
+    # append a chunk of message objects as one row group, returning True if this finished a file
+    def write(self, message_objects):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if len(message_objects) == 0:
+            return False
+        rows = [message_object.dictify() for message_object in message_objects]
+        table = pa.table({col: [None if row[col] is None else str(row[col]) for row in rows] for col in self.columns},
+                         schema=self.schema)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path(), self.schema, compression=self.compression)
+        self.writer.write_table(table, row_group_size=len(rows))
+        self.num_row_groups += 1
+        if self.num_row_groups >= self.row_groups_per_file:
+            self.close()
+            return True
+        return False
+
+    # finish the current file
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.num_row_groups = 0
+            self.num_files += 1
 
 
 class MessageObject():
@@ -3,22 +3,20 @@ Write a dataframe with only the necessary columns for email thread analysis
 to disk.
 """
 import pandas as pd
-import math
 import numpy as np
-from dateutil import parser
-from tqdm import tqdm
 from csv_aggregation import full_email_df
 
 
+sentiment_columns = ['sub-neg', 'sub-neu', 'sub-pos', 'sub-com', 'con-neg', 'con-neu', 'con-pos', 'con-com']
+# upper bounds in hours of the response time categories 1 to 5, anything slower is category 6
+response_time_bins = [4, 8, 24, 72, 168]
+
+
 # function to collect the email ids of emails which belong to a thread
 def collect_chain_ids(df):
-    chain_email_ids = set([])
-    for i, row in tqdm(df.iterrows()):
-        # if the parent column is not nan, add both this email id and its parent email id
-        if not isinstance(row['parent'], float):
-            chain_email_ids.add(row['parent'])
-            chain_email_ids.add(row['id'])
-    return list(chain_email_ids)
+    # if the parent column is not nan, add both this email id and its parent email id
+    replies = df['parent'].notna()
+    return list(set(df.loc[replies, 'parent']) | set(df.loc[replies, 'id']))
 
 
 # remove emails from the df that are not part of a chain
@@ -30,56 +28,23 @@ def remove_non_chain_emails(df, chain_email_ids):
 # add a column to denote response time between emails
 # categorical variable
 def add_response_time_column(df):
-
-    # add new columns of nan values
-    df["response-time"] = np.nan
-    df['parent-sub-neg'] = np.nan
-    df['parent-sub-neu'] = np.nan
-    df['parent-sub-pos'] = np.nan
-    df['parent-sub-com'] = np.nan
-    df['parent-con-neg'] = np.nan
-    df['parent-con-neu'] = np.nan
-    df['parent-con-pos'] = np.nan
-    df['parent-con-com'] = np.nan
-
-    for i, row in tqdm(df.iterrows()):
-        if not isinstance(row['parent'], float):
-            parent_email = df.loc[df['id'] == row['parent']]
-            if parent_email.empty:
-                print("couldn't find parent email for id: {row}".format(row=row['id']))
-                continue
-
-            # get sentiments of parent email
-            df.loc[i, 'parent-sub-neg'] = parent_email['sub-neg'].values[0]
-            df.loc[i, 'parent-sub-neu'] = parent_email['sub-neu'].values[0]
-            df.loc[i, 'parent-sub-pos'] = parent_email['sub-pos'].values[0]
-            df.loc[i, 'parent-sub-com'] = parent_email['sub-com'].values[0]
-            df.loc[i, 'parent-con-neg'] = parent_email['con-neg'].values[0]
-            df.loc[i, 'parent-con-neu'] = parent_email['con-neu'].values[0]
-            df.loc[i, 'parent-con-pos'] = parent_email['con-pos'].values[0]
-            df.loc[i, 'parent-con-com'] = parent_email['con-com'].values[0]
-
-            row_timestamp = parser.parse(row['timestamp'])
-            parent_timestamp = parser.parse(parent_email['timestamp'].values[0])
-            timedelta = row_timestamp - parent_timestamp
-            hours = timedelta.days * 24 + timedelta.seconds // 3600
-
-            # response time categories, created by # of hours
-            response_time_category = None
-            if hours < 4:
-                response_time_category = 1
-            elif hours < 8:
-                response_time_category = 2
-            elif hours < 24:
-                response_time_category = 3
-            elif hours < 72:
-                response_time_category = 4
-            elif hours < 168:
-                response_time_category = 5
-            else:
-                response_time_category = 6
-
-            df.loc[i, 'response-time'] = response_time_category
+    # join replies to their parents on parent -> id in one pass, taking the first email with a given id
+    parents = df.loc[df['id'].notna(), ['id', 'timestamp'] + sentiment_columns].drop_duplicates('id')
+    parents.columns = ['parent', 'parent-timestamp'] + ['parent-' + col for col in sentiment_columns]
+    joined = df[['parent']].reset_index(drop=True).merge(parents, on='parent', how='left', indicator=True)
+    found = (joined['_merge'] == 'both').to_numpy()
+
+    for email_id in df['id'][df['parent'].notna().to_numpy() & ~found]:
+        print("couldn't find parent email for id: {row}".format(row=email_id))
+
+    # whole hours between parent and reply, bucketed into response time categories
+    response_times = pd.to_datetime(df['timestamp']).reset_index(drop=True) - pd.to_datetime(joined['parent-timestamp'])
+    hours = response_times // pd.Timedelta(hours=1)
+    df["response-time"] = np.where(hours.notna(), np.digitize(hours, response_time_bins) + 1, np.nan)
+
+    # sentiments of parent email
+    for col in sentiment_columns:
+        df['parent-' + col] = joined['parent-' + col].to_numpy()
 
     return df
 
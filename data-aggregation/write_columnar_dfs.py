@@ -0,0 +1,23 @@
+"""
+Script to convert the email-indexed and individually-indexed csv dataframes
+to typed columnar (parquet) dataframes, written next to the csvs
+"""
+import time
+from tqdm import tqdm
+from csv_aggregation import write_columnar_df
+
+
+# batch email dataframes, sorted by timestamp so timestamp filters skip row groups
+for batch_num in tqdm(range(18)):
+    write_columnar_df('batch' + str(batch_num) + '_email_df', sort_by='timestamp')
+
+# response time dataframes for the sampled batches
+for batch_num in [6, 9, 12]:
+    write_columnar_df('response_time_df_' + str(batch_num), sort_by='timestamp')
+
+# individually-indexed dataframes
+for df_name in ['full_individual_df', 'sent_received_length_df']:
+    s = time.time()
+    write_columnar_df(df_name)
+    e = time.time()
+    print("Converting " + df_name + " took " + str(round(e - s, 4)) + " seconds.")
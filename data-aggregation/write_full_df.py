@@ -1,8 +1,7 @@
 """
 Script to aggregate and write an initial individually-indexed dataframe to disk
 """
-import pandas as pd
-from csv_aggregation import create_individual_db_dict
+from csv_aggregation import create_individual_table
 
 
 df_name = 'full_df'
@@ -17,7 +16,6 @@ if not remove_metadata:
 
 # aggregate and write
 batch_nums = [i for i in range(18)]
-d = create_individual_db_dict(batch_nums, columns=df_columns, list_count_limit=10, remove_metadata=remove_metadata)
-df = pd.DataFrame.from_dict(d, orient='index', columns=columns)
-df = df.reset_index(drop=True)
+table = create_individual_table(batch_nums, columns=df_columns, list_count_limit=10)
+df = table.to_df(columns)
 df.to_csv('dataframes/' + df_name + '.csv')
@@ -32,7 +32,8 @@ column_names = ['id',  # email id
                 'con-jefes-wf', # number of crypto related stopwords in content
                 'sub-felipes-wf', # number of semitic related stopwords in subject
                 'sub-jefes-wf', # number of crypto related stopwords in subject
-                'topic' # calculated topic
+                'topic', # calculated topic
+                'list-name' # name of the mailing list
                 ]
 
 # define a list of content topics for the parser to count relevant stopwords
@@ -42,13 +43,16 @@ content_topics = ['semitism', 'crypto', 'felipes', 'jefes']
 printed_columns = ['id', 'content-length', 'affiliation']
 
 
-# use batch processing
-for i in range(14, 18):
-    # name of csv file to save to
-    df_name = 'batch' + str(i) + '_email_df'
-    batch_nums = [i]
-    # use helper function to create full dataframe
-    df = create_email_pd(batch_nums, column_names, content_topics, list_count_limit=float('inf'), parent_dir=False)
-    # reset index and print
-    df = df.reset_index(drop=True)
-    df.to_csv('./dataframes/' + df_name + '.csv')
+# use batch processing. create_email_pd starts a process pool, so the batches are only processed when
+# this file is run as a script and not when worker processes re-import it
+if __name__ == '__main__':
+    for i in range(14, 18):
+        # name of csv file to save to
+        df_name = 'batch' + str(i) + '_email_df'
+        batch_nums = [i]
+        # use helper function to create full dataframe
+        df = create_email_pd(batch_nums, column_names, content_topics, list_count_limit=float('inf'), parent_dir=False,
+                            sentiment_cache_path='./dataframes/sentiment_cache.sqlite')
+        # reset index and print
+        df = df.reset_index(drop=True)
+        df.to_csv('./dataframes/' + df_name + '.csv')
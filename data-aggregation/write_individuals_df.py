@@ -2,8 +2,7 @@
 Script to aggregate and write the full individually-indexed dataframe to disk,
 including sentiments and topics
 """
-import pandas as pd
-from csv_aggregation import create_individual_db_from_email_dfs
+from individual_aggregates import IndividualAggregateStore
 
 df_name = 'full_individual_df'
 # columns of interest
@@ -28,7 +27,8 @@ email_column_names = ['id',  # email id
                     'con-crypto-wf', # number of crypto related stopwords in content
                     'sub-semitic-wf', # number of semitic related stopwords in subject
                     'sub-crypto-wf', # number of crypto related stopwords in subject
-                    'topic' # categorized topic
+                    'topic', # categorized topic
+                    'list-name' # name of the mailing list, to only fold new lists
                     ]
 individual_column_names = ['email',
                             'affiliation',
@@ -75,5 +75,8 @@ individual_column_names = ['email',
                             ]
 
 batch_nums = [i for i in range(18)]
-full_ind_df = create_individual_db_from_email_dfs(batch_nums, email_column_names, individual_column_names)
+# only batches and lists that were not folded into the stored aggregates yet are read
+store = IndividualAggregateStore('./dataframes/individual_aggregates/')
+store.fold_batches(batch_nums, email_column_names)
+full_ind_df = store.individual_df(individual_column_names)
 full_ind_df.to_csv('./dataframes/' + df_name + '.csv')
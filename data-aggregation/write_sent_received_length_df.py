@@ -2,8 +2,7 @@
 Script to aggregate and write an individually-indexed dataframe to disk,
 only containing metadata about email content length
 """
-import pandas as pd
-from csv_aggregation import create_individual_db_dict
+from csv_aggregation import create_individual_table
 
 df_name = 'sent_received_length_df'
 columns = ['email', 'affiliation', 'num_emails_sent', 'num_emails_received', 'avg_sent_content_length']
@@ -16,7 +15,6 @@ if not remove_metadata:
 
 # aggregate and write
 batch_nums = [i for i in range(18)]
-d = create_individual_db_dict(batch_nums, columns=df_columns, list_count_limit=float('inf'), remove_metadata=remove_metadata)
-df = pd.DataFrame.from_dict(d, orient='index', columns=columns)
-df = df.reset_index(drop=True)
+table = create_individual_table(batch_nums, columns=df_columns, list_count_limit=float('inf'))
+df = table.to_df(columns)
 df.to_csv('dataframes/' + df_name + '.csv')
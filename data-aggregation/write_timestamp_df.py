@@ -3,8 +3,7 @@ Script to aggregate and write an individually-indexed dataframe to disk,
 only containing metadata about individuals' timestamps about first and last emails
 sent.
 """
-import pandas as pd
-from csv_aggregation import create_individual_db_dict
+from csv_aggregation import create_individual_table
 df_name = 'timestamp_df'
 columns = ['email', 'first_sent_email_timestamp', 'last_sent_email_timestamp', 'avg_sent_email_timestamp']
 df_columns = columns
@@ -16,7 +15,6 @@ if not remove_metadata:
 
 # aggregate and write
 batch_nums = [i for i in range(1)]
-d = create_individual_db_dict(batch_nums, columns=df_columns, list_count_limit=10, remove_metadata=remove_metadata)
-df = pd.DataFrame.from_dict(d, orient='index', columns=columns)
-df = df.reset_index(drop=True)
+table = create_individual_table(batch_nums, columns=df_columns, list_count_limit=10)
+df = table.to_df(columns)
 df.to_csv('dataframes/' + df_name + '.csv')
@@ -10,7 +10,7 @@ enable_features("contrib")
 import datetime
 import sys
 sys.path.append('../data-aggregation/')
-from csv_aggregation import create_full_pd
+from csv_aggregation import fold_email_df
 sys.path.append('../')
 from opendp_helpers import *
 
@@ -56,9 +56,6 @@ column_names = ["timestamp",
                 "topic"]
 # specify batch numbers. All emails are spread over 18 batches
 batch_nums = [i for i in range(18)]
-# use helper function to create full dataframe
-df = full_email_df(batch_nums, column_names, parent_dir=True)
-df = df.reset_index(drop=True)
 
 # create timestamp bins of one month since Jan 2000
 u1 = datetime.datetime.strptime("2000-01-01","%Y-%m-%d")
@@ -70,18 +67,35 @@ timestamp_bins = [(u1, u2)]
 for i in range(25):
     timestamp_bins.append((timestamp_bins[i][1], timestamp_bins[i][1] + d_w))
 
-# define counting transformations and measurements
+# tally emails by time bin and topic while streaming the batch email dataframes, so that
+# only the running counts are held in memory no matter how many batches are read
+bin_edges = np.array([str(bin[0]) for bin in timestamp_bins] + [str(timestamp_bins[-1][1])])
+num_topics = 7
+
+
+# fold one chunk of emails into the running counts
+def tally_topics_by_bin(counts, chunk):
+    has_timestamp = chunk['timestamp'].notna().to_numpy()
+    timestamps = chunk['timestamp'].to_numpy()[has_timestamp].astype(str)
+    topics = chunk['topic'].to_numpy()[has_timestamp].astype(np.int64)
+    # same comparisons as filtering on bin[0] <= timestamp < bin[1]
+    bin_indices = np.searchsorted(bin_edges, timestamps, side='right') - 1
+    in_range = (bin_indices >= 0) & (bin_indices < len(timestamp_bins))
+    counts += np.bincount(bin_indices[in_range] * num_topics + topics[in_range],
+                        minlength=counts.size).reshape(counts.shape)
+    return counts
+
+
+topic_counts = fold_email_df(batch_nums, column_names, tally_topics_by_bin,
+                            np.zeros((len(timestamp_bins), num_topics), dtype=np.int64), parent_dir=True)
+
+# define counting measurements
 # each person can only contribute one row
 max_contributions = 1
-# define metadata according to df structure
-metadata = {"column_names": ['index'] + list(df.columns)}
-
-# create column transformation, any column will do because it's for a count measurement
-col_trans = create_col_trans('timestamp', str, metadata)
-# create the counting transformation
-count_trans = create_count_trans(col_trans)
-# create the counting measurement, privacy budget of 0.5
-count_meas = make_meas(count_trans, budget=0.5, max_contributions=1)
+# release the dp counts of every (time bin, topic) cell with one measurement, privacy budget
+# of 0.5. Each email falls in exactly one cell, so the cells share the budget of a single count
+histogram_meas = make_meas(create_histogram_space(topic_counts.size), budget=0.5, max_contributions=1)
+dp_topic_counts = np.array(histogram_meas(topic_counts.ravel().tolist())).reshape(topic_counts.shape)
 
 # initialize private data arrays
 dp_arts_emails_by_month = []
@@ -102,30 +116,19 @@ normalized_dp_service_emails_by_month = []
 
 # find the dp count for each topic for each month
 for i, bin in tqdm(enumerate(timestamp_bins)):
-    # filter by time bin (month granularity)
-    time_binned_df = df[(df['timestamp'] >= str(bin[0])) & (df['timestamp'] < str(bin[1]))]
     """
     Topic mappings from ../data-aggregation/helpers.py:
     {'arts': 0, 'athletics': 1, 'culture': 2,
     'miscellaneous': 3, 'politics': 4, 'preprofessional': 5, 'service': 6}
     """
-    # filtered df for each of the topics
-    arts_df = time_binned_df[time_binned_df['topic'] == 0]
-    athletics_df = time_binned_df[time_binned_df['topic'] == 1]
-    culture_df = time_binned_df[time_binned_df['topic'] == 2]
-    misc_df = time_binned_df[time_binned_df['topic'] == 3]
-    political_df = time_binned_df[time_binned_df['topic'] == 4]
-    preprofessional_df = time_binned_df[time_binned_df['topic'] == 5]
-    service_df = time_binned_df[time_binned_df['topic'] == 6]
-
-    # create a private count for each of the topics
-    dp_arts_count = count_meas(arts_df.to_csv())
-    dp_athletics_count = count_meas(athletics_df.to_csv())
-    dp_culture_count = count_meas(culture_df.to_csv())
-    dp_misc_count = count_meas(misc_df.to_csv())
-    dp_political_count = count_meas(political_df.to_csv())
-    dp_preprofessional_count = count_meas(preprofessional_df.to_csv())
-    dp_service_count = count_meas(service_df.to_csv())
+    # private count of each of the topics
+    dp_arts_count = int(dp_topic_counts[i, 0])
+    dp_athletics_count = int(dp_topic_counts[i, 1])
+    dp_culture_count = int(dp_topic_counts[i, 2])
+    dp_misc_count = int(dp_topic_counts[i, 3])
+    dp_political_count = int(dp_topic_counts[i, 4])
+    dp_preprofessional_count = int(dp_topic_counts[i, 5])
+    dp_service_count = int(dp_topic_counts[i, 6])
 
     # append the private count to storage
     dp_arts_emails_by_month.append(dp_arts_count)
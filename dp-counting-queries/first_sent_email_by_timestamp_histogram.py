@@ -1,13 +1,14 @@
 """
 Script to count the number of individuals who sent their first email by month, writes to disk.
 """
-import pandas as pd
+import numpy as np
 from opendp.mod import enable_features
 enable_features("contrib")
-from tqdm import tqdm
 import json
 import sys
 import datetime
+sys.path.append('../data-aggregation/')
+from csv_aggregation import read_columnar_df
 sys.path.append('../')
 from opendp_helpers import *
 
@@ -42,21 +43,12 @@ columns = ['email',
             "num-emails-received"
             ]
 
-df = pd.read_csv("../dataframes/full_individual_df.csv", usecols=columns)
+df = read_columnar_df("full_individual_df", columns=columns, parent_dir=True)
 
 # each person can only contribute one row
 max_contributions = 1
-# define metadata according to df structure
-metadata = {"column_names": ['index'] + list(df.columns)}
 
 
-# create column transformation
-col_trans = create_col_trans('first-email-timestamp', str, metadata)
-# create the counting transformation
-count_trans = create_count_trans(col_trans)
-# create the counting measurement
-count_meas = make_meas(count_trans, budget=0.5, max_contributions=1)
-
 # construct timestamp bins
 u1 = datetime.datetime.strptime("2000-01-01","%Y-%m-%d")
 # delta of one month
@@ -67,14 +59,11 @@ for i in range(300):
     timestamp_bins.append((timestamp_bins[i][1], timestamp_bins[i][1] + d_w))
 
 
-bin_counts = {}
-min_date = '2025-01-01'
-
-# find the dp count for each time bin
-for i, bin in tqdm(enumerate(timestamp_bins)):
-    bin_df = df[df['first-email-timestamp'] >= str(bin[0])]
-    bin_df = bin_df[bin_df['first-email-timestamp'] < str(bin[1])]
-    bin_counts[i] = count_meas(bin_df.to_csv())
+# bin every timestamp once and release the dp counts of all time bins with one measurement.
+# The bins are disjoint, so together they spend the budget of a single count
+bin_edges = np.array([bin[0] for bin in timestamp_bins] + [timestamp_bins[-1][1]], dtype='datetime64[ns]')
+dp_bin_counts = release_histogram(df['first-email-timestamp'].to_numpy(), bin_edges, budget=0.5, max_contributions=1)
+bin_counts = {i: count for i, count in enumerate(dp_bin_counts)}
 
 # store the dictionary for a histogram with differentially private counts
 f = open("./dp_first_email_histogram.txt", "w")
@@ -21,17 +21,15 @@ df = df.reset_index(drop=True)
 
 # each email contributes only one email
 max_contributions = 1
-# define metadata according to df structure
-metadata = {"column_names": ['index'] + list(df.columns)}
 
 # create counting transformation for num_emails_received
-col_trans = create_col_trans("to", str, metadata)
+col_trans = create_vector_space(str)
 # create the counting measurement function
 count_trans = create_count_trans(col_trans)
 # automatically determine laplace scale based on provided budget
 count_meas = make_meas(count_trans, budget=0.5, max_contributions=1)
 
 # run function
-dp_count = count_meas(df.to_csv())
+dp_count = count_meas(column_data(df, "to", str))
 # dp count
 print('Private release of emails: ' + str(dp_count))
@@ -2,31 +2,27 @@
 Script to count the number of individuals who sent their last email by week
 and by affiliation, writes to disk.
 """
-import pandas as pd
+import numpy as np
 from opendp.mod import enable_features
 enable_features("contrib")
-from tqdm import tqdm
 import json
 import sys
 import datetime
+sys.path.append('../data-aggregation/')
+from csv_aggregation import read_columnar_df
 sys.path.append('../')
 from opendp_helpers import *
 
 
 columns = ['email', 'affiliation', 'last-email-timestamp']
-df = pd.read_csv("../dataframes/full_individual_df.csv", usecols=columns)
+domains = ['college.harvard.edu', 'fas.harvard.edu', 'gmail.com', 'hcs.harvard.edu']
+# only read individuals of the examined domains with timestamps since Jan 2000
+df = read_columnar_df("full_individual_df", columns=columns, parent_dir=True,
+                    timestamp_range=("2000-01-01", None), timestamp_column='last-email-timestamp',
+                    affiliations=domains)
 
 # each person can only contribute one row
 max_contributions = 1
-# define metadata according to df structure
-metadata = {"column_names": ['index'] + list(df.columns)}
-
-# create column transformation
-col_trans = create_col_trans('last-email-timestamp', str, metadata)
-# create the counting transformation
-count_trans = create_count_trans(col_trans)
-# create the counting measurement
-count_meas = make_meas(count_trans, budget=0.5, max_contributions=1)
 
 # construct time bins
 u1 = datetime.datetime.strptime("2000-01-01","%Y-%m-%d")
@@ -37,17 +33,12 @@ timestamp_bins = [(u1, u2)]
 for i in range(300):
     timestamp_bins.append((timestamp_bins[i][1], timestamp_bins[i][1] + d_w))
 
-domains = ['college.harvard.edu', 'fas.harvard.edu', 'gmail.com', 'hcs.harvard.edu']
-dp_counts = {k: [] for k in domains}
-
-# find the dp count for each affiliation
-for i, bin in tqdm(enumerate(timestamp_bins)):
-    # filter on first and last sent emails
-    time_binned_df = df[(df['last-email-timestamp'] >= str(bin[0])) & (df['last-email-timestamp'] < str(bin[1]))]
-    for domain in domains:
-        domain_df = time_binned_df[time_binned_df['affiliation'] == domain]
-        # find dp count
-        dp_counts[domain].append(count_meas(domain_df.to_csv()))
+# release the dp counts of the (time bin, domain) table in one pass, the counts of a bin or a
+# domain alone are slices of it
+bin_edges = np.array([bin[0] for bin in timestamp_bins] + [timestamp_bins[-1][1]], dtype='datetime64[ns]')
+codes = [bin_values(df['last-email-timestamp'].to_numpy(), bin_edges), category_codes(df['affiliation'], domains)]
+dp_table = release_contingency_table(codes, (len(timestamp_bins), len(domains)), budget=0.5, max_contributions=1)
+dp_counts = {domain: [int(count) for count in dp_table[:, j]] for j, domain in enumerate(domains)}
 
 
 # store the dictionary for a histogram with differentially private counts
@@ -3,12 +3,12 @@ Script to calculate dp average sentiment of emails by affiliation (email domain)
 writes to disk.
 """
 import os
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from tqdm import tqdm
 import json
 import sys
+sys.path.append('../data-aggregation/')
+from csv_aggregation import read_columnar_df
 sys.path.append('../')
 from opendp_helpers import *
 
@@ -43,71 +43,31 @@ columns = ['email',
             "num-emails-received"
             ]
 
-df = pd.read_csv("../dataframes/full_individual_df.csv", usecols=columns)
+df = read_columnar_df("full_individual_df", columns=columns, parent_dir=True)
 
 # grouped affiliation emails gathered from metadata scripts
 affiliations = {}
 with open('../metadata/harvard_email_affiliations.txt') as f:
     affiliations = json.loads(f.read())
 
-# storage data structures
-affiliation_com_dp_means = {k:0 for k in affiliations.keys()}
-affiliation_neg_dp_means = {k:0 for k in affiliations.keys()}
-affiliation_neu_dp_means = {k:0 for k in affiliations.keys()}
-affiliation_pos_dp_means = {k:0 for k in affiliations.keys()}
-affiliation_dp_counts = {k:0 for k in affiliations.keys()}
-
 # each person can only contribute one row
 max_contributions = 1
-# define metadata according to df structure
-metadata = {"column_names": ['index'] + list(df.columns)}
 # global length bounds of compound sentiment. This is not an estimate.
 length_bounds = (-1., 1.)
 
+# release the dp count and dp mean sentiments of every affiliation with one pass over the rows.
+# The epsilon expenditure is 0.5 for the counts plus 0.5 for each of the sentiments
+value_columns = ["avg-sent-con-com", "avg-sent-con-neg", "avg-sent-con-neu", "avg-sent-con-pos"]
+dp_df = release_grouped_means(df, 'affiliation', value_columns, length_bounds, groups=affiliations,
+                              budget=0.5, max_contributions=max_contributions)
+print(dp_df)
 
-# create column transformations
-com_col_trans = create_col_trans("avg-sent-con-com", str, metadata)
-neg_col_trans = create_col_trans("avg-sent-con-neg", str, metadata)
-neu_col_trans = create_col_trans("avg-sent-con-neu", str, metadata)
-pos_col_trans = create_col_trans("avg-sent-con-pos", str, metadata)
-
-# create the counting transformation
-count_trans = create_count_trans(com_col_trans)
-# create the counting measurement function
-count_meas = make_meas(count_trans, budget=0.5, max_contributions=1)
-
-# calculate average emails received by affiliation
-for aff in tqdm(affiliations.keys()):
-    affiliation_email_set = affiliations[aff]
-    print("*"*20 + aff + "*"*20)
-    aff_df = df[df['affiliation'].isin(affiliation_email_set)]
-
-    # calculate a count
-    aff_dp_count = count_meas(aff_df.to_csv())
-    affiliation_dp_counts[aff] = aff_dp_count
-
-    # create a mean transformation
-    com_mean_trans = create_mean_trans(length_bounds, aff_dp_count, com_col_trans, 0.)
-    neg_mean_trans = create_mean_trans(length_bounds, aff_dp_count, neg_col_trans, 0.1)
-    neu_mean_trans = create_mean_trans(length_bounds, aff_dp_count, neu_col_trans, 0.7)
-    pos_mean_trans = create_mean_trans(length_bounds, aff_dp_count, pos_col_trans, 0.2)
-    # create a mean measurement
-    com_mean_meas = make_meas(com_mean_trans, budget=0.5, max_contributions=1, verbose=True)
-    neg_mean_meas = make_meas(neg_mean_trans, budget=0.5, max_contributions=1, verbose=True)
-    neu_mean_meas = make_meas(neu_mean_trans, budget=0.5, max_contributions=1, verbose=True)
-    pos_mean_meas = make_meas(pos_mean_trans, budget=0.5, max_contributions=1, verbose=True)
-
-    # calculate means
-    com_dp_aff_mean = com_mean_meas(aff_df.to_csv())
-    neg_dp_aff_mean = neg_mean_meas(aff_df.to_csv())
-    neu_dp_aff_mean = neu_mean_meas(aff_df.to_csv())
-    pos_dp_aff_mean = pos_mean_meas(aff_df.to_csv())
-
-    # store results
-    affiliation_com_dp_means[aff] = com_dp_aff_mean
-    affiliation_neg_dp_means[aff] = neg_dp_aff_mean
-    affiliation_neu_dp_means[aff] = neu_dp_aff_mean
-    affiliation_pos_dp_means[aff] = pos_dp_aff_mean
+# storage data structures
+affiliation_com_dp_means = dp_df['avg-sent-con-com-mean'].to_dict()
+affiliation_neg_dp_means = dp_df['avg-sent-con-neg-mean'].to_dict()
+affiliation_neu_dp_means = dp_df['avg-sent-con-neu-mean'].to_dict()
+affiliation_pos_dp_means = dp_df['avg-sent-con-pos-mean'].to_dict()
+affiliation_dp_counts = dp_df['count'].to_dict()
 
 
 # store the dictionaries for a histogram with differentially private counts
@@ -1,19 +1,17 @@
 """
 Script to calculate dp average content length over time, writes to disk.
 """
-import pandas as pd
 import numpy as np
 import json
-from tqdm import tqdm
 from opendp.mod import enable_features
 enable_features("contrib")
 import datetime
 import sys
 sys.path.append('../data-aggregation/')
-from csv_aggregation import full_email_df
+from csv_aggregation import read_columnar_df
 from helpers import extract_affiliation
 sys.path.append('../')
-from transformations import *
+from opendp_helpers import *
 
 # identify columns to read from batch email dataframes
 column_names = ['first-email-timestamp',
@@ -21,8 +19,9 @@ column_names = ['first-email-timestamp',
                 'avg-content-length',
                 'affiliation']
 
-# read individual's df from disk
-df = pd.read_csv("../dataframes/full_individual_df.csv", usecols=column_names)
+# read individual's df from disk, only keeping the domains we want to examine
+df = read_columnar_df("full_individual_df", columns=column_names, parent_dir=True,
+                    affiliations=['gmail.com', 'fas.harvard.edu', 'college.harvard.edu'])
 df = df.reset_index(drop=True)
 
 # create timestamp bins of one month since Jan 2000
@@ -38,58 +37,35 @@ for i in range(300):
 # define counting transformations and measurements
 # each person can only contribute one row
 max_contributions = 1
-# define metadata according to df structure
-metadata = {"column_names": ['index'] + list(df.columns)}
-
-# create column transformation
-col_trans = create_col_trans('avg-content-length', str, metadata)
-# create the counting transformation
-count_trans = create_count_trans(col_trans)
-# create the counting measurement, privacy budget of 0.5
-count_meas = make_meas(count_trans, budget=0.5, max_contributions=1)
 
 # domains we want to examine
 domains = {'gmail.com': [], 'fas.harvard.edu': [], 'college.harvard.edu': []}
 
-# initialize storage dictionaries
-dp_counts = {k: [] for k in list(domains.keys())}
-dp_avgs = {k: [] for k in list(domains.keys())}
-
 # create a mean transformation; an upper bound of 3000 characters on average per person
 # seems reasonable, from a public standpoint: each word on average is approx. 6 chars,
 # so 3000 is about 500 words or about 2 double spaced pages
 length_bounds = (0., 5000.)
 
-# calculate average emails received by affiliation
-# find the dp count for each topic for each month
-for i, bin in tqdm(enumerate(timestamp_bins)):
-    # filter by time bin (month granularity)
-    time_binned_df = df[(df['first-email-timestamp'] >= str(bin[0])) & (df['last-email-timestamp'] < str(bin[1]))]
-    for domain in domains.keys():
-        # filter by domain of sender
-        domain_df = time_binned_df[time_binned_df['affiliation'] == domain]
-        # if there are no emails that satisfy these filters, skip
-        if len(domain_df) == 0:
-            dp_counts[domain].append(0)
-            dp_avgs[domain].append(0)
-            continue
+# an individual falls in the month bin holding both their first and last email, i.e. filtering
+# on bin[0] <= first timestamp and last timestamp < bin[1]. Each (month, domain) cell is a group
+bin_edges = np.array([bin[0] for bin in timestamp_bins] + [timestamp_bins[-1][1]], dtype='datetime64[ns]')
+first_bins = bin_values(df['first-email-timestamp'].to_numpy(), bin_edges)
+last_bins = bin_values(df['last-email-timestamp'].to_numpy(), bin_edges)
+domain_codes = category_codes(df['affiliation'], list(domains.keys()))
+df['cell'] = np.where((first_bins >= 0) & (first_bins == last_bins) & (domain_codes >= 0),
+                      first_bins * len(domains) + domain_codes, -1)
 
-        # dp count of the number of emails
-        domain_dp_count = count_meas(domain_df.to_csv())
-        # sum transformation on the columns
-        sum_trans = create_sum_trans(length_bounds, col_trans)
-        # sum measurement on the transformation, budget of 0.5
-        sum_meas = make_meas(sum_trans, budget=0.5, max_contributions=1, verbose=False)
-        # calculate the average by dividing by the dp number of entries
-        domain_dp_avg_email_length = None
-        if domain_dp_count == 0:
-            domain_dp_avg_email_length = sum_meas(domain_df.to_csv()) / 1
-        else:
-            domain_dp_avg_email_length = sum_meas(domain_df.to_csv()) / domain_dp_count
+# release the dp counts and dp average content lengths of every cell with one pass over the rows,
+# privacy budget of 0.5 for the counts and 0.5 for the sums
+cells = [i * len(domains) + j for i in range(len(timestamp_bins)) for j in range(len(domains))]
+dp_df = release_grouped_means(df, 'cell', ['avg-content-length'], length_bounds, groups=cells,
+                              budget=0.5, max_contributions=max_contributions, verbose=False)
 
-        # store dp values
-        dp_counts[domain].append(domain_dp_count)
-        dp_avgs[domain].append(domain_dp_avg_email_length)
+# storage dictionaries
+dp_counts = {domain: [int(dp_df['count'][i * len(domains) + j]) for i in range(len(timestamp_bins))]
+             for j, domain in enumerate(domains.keys())}
+dp_avgs = {domain: [float(dp_df['avg-content-length-mean'][i * len(domains) + j]) for i in range(len(timestamp_bins))]
+           for j, domain in enumerate(domains.keys())}
 
 
 # store private data dictionary to disk
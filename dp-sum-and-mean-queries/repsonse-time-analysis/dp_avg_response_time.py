@@ -11,6 +11,8 @@ import sys
 from diffprivlib import tools
 import time
 import math
+sys.path.append('../data-aggregation/')
+from csv_aggregation import read_columnar_df
 sys.path.append('../')
 from opendp_helpers import *
 
@@ -45,15 +47,15 @@ columns = ['id',  # email id
             ]
 
 # response time dataframes for a randomly selected 3 out of 18 batches of total emails
-df_1 = pd.read_csv("../dataframes/response_time_df_6.csv", usecols=columns)
-df_2 = pd.read_csv("../dataframes/response_time_df_9.csv", usecols=columns)
-df_3 = pd.read_csv("../dataframes/response_time_df_12.csv", usecols=columns)
+df_1 = read_columnar_df("response_time_df_6", columns=columns, parent_dir=True)
+df_2 = read_columnar_df("response_time_df_9", columns=columns, parent_dir=True)
+df_3 = read_columnar_df("response_time_df_12", columns=columns, parent_dir=True)
 # concatenate response time dataframes
 df = pd.concat([df_1, df_2], ignore_index=True)
 df = pd.concat([df, df_3], ignore_index=True)
 
 # get all of the root email ids, denoted by nan value in parent column
-parent_email_df = df[df['parent'].apply(lambda x: isinstance(x, float))]
+parent_email_df = df[df['parent'].isna()]
 root_emails = parent_email_df['id'].tolist()
 root_emails = {id: [] for id in root_emails}
 
@@ -74,16 +76,14 @@ time_bins = [1, 2, 3, 4, 5, 6]
 
 # each email can only contribute one independent response
 max_contributions = 1
-# define metadata according to df structure
-metadata = {"column_names": ['index'] + list(df.columns)}
 # length bounds of compound sentiment. This is not an estimate.
 length_bounds = (-1., 1.)
 
 
 # create column transformation for count
-id_col_trans = create_col_trans("id", str, metadata)
+id_col_trans = create_vector_space(str)
 # column transformation for mean parent sentiment
-parent_sentiment_trans = create_col_trans('parent-con-com', str, metadata)
+parent_sentiment_trans = create_vector_space(float)
 
 # create the counting transformation
 count_trans = create_count_trans(id_col_trans)
@@ -102,7 +102,7 @@ for time_bin in time_bins:
     time_binned_df = df[df['response-time'] == time_bin]
 
     # define count measurement and apply it
-    dp_count = count_meas(time_binned_df.to_csv())
+    dp_count = count_meas(column_data(time_binned_df, "id", str))
     dp_binned_counts[time_bin] = dp_count
 
     # calculate differentially private standard deviation via IBM's diffprivlib library
@@ -114,7 +114,7 @@ for time_bin in time_bins:
     com_mean_trans = create_mean_trans(length_bounds, dp_count, parent_sentiment_trans, 0.)
     com_mean_meas = make_meas(com_mean_trans, budget=0.5, max_contributions=1, verbose=True)
     # calculate means
-    dp_parent_sentiment_mean = com_mean_meas(time_binned_df.to_csv())
+    dp_parent_sentiment_mean = com_mean_meas(column_data(time_binned_df, 'parent-con-com', float))
     dp_binned_avg_sentiments[time_bin] = dp_parent_sentiment_mean
 
 
@@ -18,11 +18,13 @@ from helpers import Extractor
 # help from https://www.geeksforgeeks.org/visualize-graphs-in-python/
 class EmailNetworkGraph:
 
-    def __init__(self, email_df):
+    def __init__(self, email_df=None):
         self.n = 0
         self.num_edges = 0
         self.extractor = Extractor([], parent_dir=True)
-        self.G = self.construct_graph(email_df)
+        self.G = nx.Graph()
+        if email_df is not None:
+            self.G = self.construct_graph(email_df)
         # node_shape options: 'so^>v<dph8'
         self.vis_config = {'cmap': plt.get_cmap('viridis'), 'font_size':10, 'node_shape':'h', 'node_size':150, 'alpha':0.6}
 
@@ -30,6 +32,14 @@ class EmailNetworkGraph:
     def construct_graph(self, email_df, verbose=False):
         # create nx graph object
         G = nx.Graph()
+        self.add_emails(email_df, G, verbose)
+        return G
+
+    # add the nodes and edges of an input dataframe to a graph, so that a graph
+    # can be built up from streamed email chunks
+    def add_emails(self, email_df, G=None, verbose=False):
+        if G is None:
+            G = self.G
 
         # collect emails
         receiver_emails = set(list(email_df['to'].unique()))
@@ -41,19 +51,18 @@ class EmailNetworkGraph:
 
         # create all the nodes
         for email_address in all_email_addresses:
-            G.add_node(email_address)
-            # update number of nodes
-            self.n += 1
+            if email_address not in G:
+                G.add_node(email_address)
+                # update number of nodes
+                self.n += 1
 
         if verbose:
             print('Creating graph edges... ')
 
         # fill in all the edges
-        for i, row in email_df.iterrows():
-            edge = (row['to'], row['from'])
-            G.add_edge(*edge)
-            # update number of edges
-            self.num_edges += 1
+        G.add_edges_from(zip(email_df['to'], email_df['from']))
+        # update number of edges
+        self.num_edges += len(email_df)
 
         return G
 
@@ -10,7 +10,7 @@ from datetime import datetime
 from EmailNetworkGraph import EmailNetworkGraph
 import sys
 sys.path.append('../data-aggregation/')
-from csv_aggregation import full_email_df
+from csv_aggregation import iter_email_df
 
 
 num_lists = 18
@@ -18,12 +18,6 @@ email_count_limit = float("inf")
 batch_nums = [i for i in range(num_lists)]
 # columns of interest
 email_column_names = ['id', 'to', 'from', 'to-affiliation', 'from-affiliation', 'timestamp']
-# construct full email df
-s = time.time()
-df = full_email_df(batch_nums, email_column_names, parent_dir=True, email_count_limit=email_count_limit)
-e = time.time()
-t = round(e - s, 4)
-print("Reading email csvs took " + str(t) + " seconds.")
 # subgraphs we are interested in
 connection_pairings = [('fas.harvard.edu', 'fas.harvard.edu'),
                         ('fas.harvard.edu', 'college.harvard.edu'),
@@ -36,32 +30,43 @@ connection_pairings = [('fas.harvard.edu', 'fas.harvard.edu'),
 u1 = '2000'
 u2 = '2001'
 timestamp_bins = [('2000', '2004'),('2004', '2008'), ('2008', '2012'), ('2012', '2016'), ('2016', '2020'), ('2020', '2024')]
+
+# one graph per subgraph, plus the full graph from 2020 to 2024
+subgraphs = {(bin, pairing): EmailNetworkGraph() for bin in timestamp_bins for pairing in connection_pairings}
+network_graph = EmailNetworkGraph()
+
+# stream the email csvs so that only one chunk of emails is in memory at a time,
+# folding each chunk into the graphs
+s = time.time()
+for df in iter_email_df(batch_nums, email_column_names, parent_dir=True, email_count_limit=email_count_limit):
+    for bin in timestamp_bins:
+        time_binned_df = df[(df['timestamp'] >= bin[0]) & (df['timestamp'] < bin[1])]
+        for pairing in connection_pairings:
+            paired_df = None
+            if pairing[0] == pairing[1]:
+                paired_df = time_binned_df[(time_binned_df['to-affiliation'] == pairing[0]) & (time_binned_df['from-affiliation'] == pairing[1])]
+            else:
+                forward_paired_df = time_binned_df[(time_binned_df['to-affiliation'] == pairing[0]) & (time_binned_df['from-affiliation'] == pairing[1])]
+                backward_paired_df = time_binned_df[(time_binned_df['to-affiliation'] == pairing[1]) & (time_binned_df['from-affiliation'] == pairing[0])]
+                frames = [forward_paired_df, backward_paired_df]
+                paired_df = pd.concat(frames)
+            subgraphs[(bin, pairing)].add_emails(paired_df)
+
+    # filter df
+    df = df[(df['timestamp'] > '2020-01-01') & (df['timestamp'] < '2024-01-01')]
+    # add to network graph
+    network_graph.add_emails(df)
+e = time.time()
+t = round(e - s, 4)
+print("Reading email csvs and constructing the graphs took " + str(t) + " seconds.")
+
 file_names = []
 for bin in tqdm(timestamp_bins):
-    time_binned_df = df[(df['timestamp'] >= bin[0]) & (df['timestamp'] < bin[1])]
     for pairing in connection_pairings:
-        paired_df = None
-        if pairing[0] == pairing[1]:
-            paired_df = time_binned_df[(time_binned_df['to-affiliation'] == pairing[0]) & (time_binned_df['from-affiliation'] == pairing[1])]
-        else:
-            forward_paired_df = time_binned_df[(time_binned_df['to-affiliation'] == pairing[0]) & (time_binned_df['from-affiliation'] == pairing[1])]
-            backward_paired_df = time_binned_df[(time_binned_df['to-affiliation'] == pairing[1]) & (time_binned_df['from-affiliation'] == pairing[0])]
-            frames = [forward_paired_df, backward_paired_df]
-            paired_df = pd.concat(frames)
-
-        network_graph = EmailNetworkGraph(paired_df)
         file_name = bin[0] + '-' + bin[1] + '--' + str(pairing[0]) + '-' + str(pairing[1])
-        network_graph.save_graph(file_name=file_name)
+        subgraphs[(bin, pairing)].save_graph(file_name=file_name)
         file_names.append(file_name)
 
-# filter df
-df = df[(df['timestamp'] > '2020-01-01') & (df['timestamp'] < '2024-01-01')]
-# create network graph
-s = time.time()
-network_graph = EmailNetworkGraph(df)
-e = time.time()
-t = round(e - s, 4)
-print("Constructing the graph took " + str(t) + " seconds.")
 # construct file name for visualization and pickle file based on number of lists included
 file_name = "2020_to_2024"
 # only produce the visualization if there are fewer than 100,000 nodes
@@ -90,16 +90,14 @@ def compute_avg_degree_connectivity(G, alpha, epsilon=1):
     df = df.rename(columns={0: "index"})
     # each node only contributes one row
     max_contributions = 1
-    # define metadata according to df structure
-    metadata = {"column_names": ["index"]}
-    # create column transformation
-    col_trans = create_col_trans("index", str, metadata)
+    # create the input space of the column
+    col_trans = create_vector_space(str)
     # create the counting transformation
     count_trans = create_count_trans(col_trans)
     # create the counting measurement
     count_meas = make_meas(count_trans, budget=0.5, max_contributions=1)
     # make the private count release
-    dp_node_count = count_meas(df.to_csv())
+    dp_node_count = count_meas(column_data(df, "index", str))
 
     return flow_based_dp_edges, dp_node_count
 
@@ -1,6 +1,11 @@
 """
 Foundational transformation and measurement constructors.
 """
+import os
+import json
+from collections import Counter
+import numpy as np
+import pandas as pd
 from opendp.transformations import make_split_dataframe, make_select_column
 from opendp.transformations import then_cast_default, then_clamp, then_resize, then_mean, then_sum
 from opendp.transformations import then_count
@@ -8,19 +13,65 @@ from opendp.measurements import then_laplace
 from opendp.mod import enable_features, binary_search_param
 from opendp.accuracy import laplacian_scale_to_accuracy
 from opendp.measurements import then_base_laplace
-from opendp.domains import atom_domain
+from opendp.domains import atom_domain, vector_domain
+from opendp.metrics import absolute_distance, symmetric_distance, l1_distance
 enable_features("contrib")
 
 
+"""
+Cache of calibrated Laplacian noise scales. The scale only depends on the space a transformation
+outputs, its sensitivity for max_contributions and the budget, so it is calibrated once per key.
+Given a path, calibrations are also kept in a json file across runs.
+"""
+class ScaleCache():
+    def __init__(self, path=None):
+        self.path = path
+        self.scales = {}
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.scales = json.load(f)
+
+
+    # find the smallest scale that keeps the transformation (or input space) within the budget
+    def calibrate(self, transformation, budget, max_contributions):
+        if isinstance(transformation, tuple):
+            # an input space such as create_count_space(), where the values are already aggregated
+            output_domain, output_metric = transformation
+            sensitivity = max_contributions
+        else:
+            output_domain, output_metric = transformation.output_domain, transformation.output_metric
+            sensitivity = transformation.map(d_in=max_contributions)
+        key = '|'.join([str(output_domain), str(output_metric), repr(sensitivity), repr(max_contributions), repr(budget)])
+        if key in self.scales:
+            return self.scales[key]
+
+        make_chain = lambda s: transformation >> then_laplace(s)
+        # the laplace mechanism spends sensitivity / scale. Its privacy map rounds conservatively,
+        # so check the analytic scale and only search for one if it does not fit the budget
+        scale = sensitivity / budget
+        if not make_chain(scale).map(d_in=max_contributions) <= budget:
+            scale = binary_search_param(make_chain, d_in=max_contributions, d_out=budget)
+
+        self.scales[key] = scale
+        if self.path is not None:
+            with open(self.path, 'w') as f:
+                json.dump(self.scales, f)
+        return scale
+
+
+# calibrations shared by every measurement built in a process
+scale_cache = ScaleCache()
+
+
 """
 Function to calibrate Laplacian noise scale to a given privacy budget.
 Output: a private measurement function.
 """
-def make_meas(transformation, budget=0.5, max_contributions=1, alpha=0.05, verbose=True):
+def make_meas(transformation, budget=0.5, max_contributions=1, alpha=0.05, verbose=True, cache=scale_cache):
     # instantiate lambda function
     make_chain = lambda s: transformation >> then_laplace(s)
-    # use OpenDP's built-in binary_search_param() function to find correct scale
-    scale = binary_search_param(make_chain, d_in=max_contributions, d_out=budget)
+    # look the scale up, calibrating it the first time
+    scale = cache.calibrate(transformation, budget, max_contributions)
     # create the measurement using the lambda function
     measurement = make_chain(scale)
     # calculate the measurement's corresponding accuracy
@@ -46,6 +97,199 @@ def create_col_trans(col_name, col_type, metadata):
     return col_trans
 
 
+# create the input space of a single column passed in directly as a list, rather than parsed
+# out of a csv string by create_col_trans. Count, sum and mean transformations chain onto it the
+# same way, and measurements on it take column_data(df, col_name, col_type)
+def create_vector_space(col_type):
+    return vector_domain(atom_domain(T=col_type)), symmetric_distance()
+
+
+# extract a dataframe column as the list a chain on create_vector_space takes. Missing values
+# become the type's default, as then_cast_default turns empty csv fields into it
+def column_data(df, col_name, col_type):
+    return df[col_name].fillna(col_type()).astype(col_type).tolist()
+
+
+# create the input space of a count that has already been tallied (e.g. while streaming
+# email batches). A count changes by at most max_contributions between neighboring datasets,
+# so a measurement on this space is calibrated the same way as one on create_count_trans
+def create_count_space():
+    return atom_domain(T=int), absolute_distance(T=int)
+
+
+# create the input space of a histogram that has already been tallied over disjoint bins. Every
+# row falls in at most one bin, so between neighboring datasets the vector of counts changes by
+# at most max_contributions in total (parallel composition), and a measurement on this space
+# spends the budget once for all of its bins
+def create_histogram_space(num_bins):
+    return vector_domain(atom_domain(T=int), size=num_bins), l1_distance(T=int)
+
+
+# find the bin [bin_edges[i], bin_edges[i + 1]) of each value, the same bin filtering on
+# bin[0] <= value < bin[1] puts it in. Values outside of every bin (or missing) get -1
+def bin_values(values, bin_edges):
+    bin_indices = np.searchsorted(bin_edges, values, side='right') - 1
+    bin_indices[bin_indices >= len(bin_edges) - 1] = -1
+    return bin_indices
+
+
+# tally the values of a column into bins with a single pass
+def histogram_counts(values, bin_edges):
+    bin_indices = bin_values(values, bin_edges)
+    return np.bincount(bin_indices[bin_indices >= 0], minlength=len(bin_edges) - 1)
+
+
+"""
+Function to release a differentially private histogram of a column over the disjoint bins
+[bin_edges[i], bin_edges[i + 1]). The column is binned once and Laplacian noise is added to
+the whole vector of counts with one measurement.
+Output: a list of private counts, one per bin.
+"""
+def release_histogram(values, bin_edges, budget=0.5, max_contributions=1, verbose=True):
+    counts = histogram_counts(values, bin_edges)
+    histogram_meas = make_meas(create_histogram_space(len(counts)), budget=budget,
+                               max_contributions=max_contributions, verbose=verbose)
+    return histogram_meas(counts.tolist())
+
+
+# find the position of each value in a list of categories. Missing values and values in none
+# of them get -1, as filtering on value == category never selects a missing value
+def category_codes(values, categories):
+    codes = pd.Index(categories).get_indexer(values)
+    codes[pd.isna(np.asarray(values))] = -1
+    return codes
+
+
+# tally rows into an N-dimensional table of counts, given the rows' codes along each dimension
+# (from category_codes or bin_values). Rows with a -1 code along any dimension are left out
+def contingency_counts(codes, shape):
+    in_table = np.logical_and.reduce([np.asarray(dimension_codes) >= 0 for dimension_codes in codes])
+    cells = np.ravel_multi_index([np.asarray(dimension_codes)[in_table] for dimension_codes in codes], shape)
+    return np.bincount(cells, minlength=int(np.prod(shape))).reshape(shape)
+
+
+"""
+Function to release a differentially private N-dimensional contingency table, e.g. of counts by
+topic, month and affiliation, from the rows' codes along each dimension. The table is tallied in
+one pass and Laplacian noise is added to all of its cells with one measurement: every row falls
+in at most one cell, so the whole table spends the budget of a single count. Marginals and slices
+of the released table are post-processing and cost no further budget.
+Output: a numpy array of private counts with the given shape.
+"""
+def release_contingency_table(codes, shape, budget=0.5, max_contributions=1, verbose=True):
+    counts = contingency_counts(codes, shape)
+    table_meas = make_meas(create_histogram_space(counts.size), budget=budget,
+                           max_contributions=max_contributions, verbose=verbose)
+    return np.array(table_meas(counts.ravel().tolist())).reshape(shape)
+
+
+# sum a released contingency table over the given axes, leaving the marginal of the others
+def marginalize(table, axes):
+    return table.sum(axis=tuple(axes))
+
+
+# create the input space of sums that have already been aggregated over num_groups groups.
+# Measurements on it take the sums' sensitivity as their max_contributions
+def create_sum_space(num_groups):
+    return vector_domain(atom_domain(T=float), size=num_groups), l1_distance(T=float)
+
+
+# code the rows of a dataframe by the value of a key column and map the distinct keys to groups.
+# Groups default to one per distinct key, a list of keys makes one group per key and a dict
+# maps group names to the keys they contain. Also returns the number of groups a single row can
+# fall in, which scales the sensitivity of every grouped count and sum
+def group_rows(df, key_column, groups=None):
+    key_codes, keys = pd.factorize(df[key_column])
+    if groups is None:
+        groups = list(keys)
+    if not isinstance(groups, dict):
+        groups = {key: [key] for key in groups}
+    membership = np.zeros((len(keys), len(groups)), dtype=np.int64)
+    for j, group_keys in enumerate(groups.values()):
+        positions = pd.Index(keys).get_indexer(list(group_keys))
+        membership[positions[positions >= 0], j] = 1
+    # taken from the group definitions rather than the data, so it does not depend on the rows
+    overlap = max(Counter(key for group_keys in groups.values() for key in set(group_keys)).values(), default=1)
+    return key_codes, membership, list(groups), overlap
+
+
+# sum clamped values of a column within every group with one pass over the rows. Missing values
+# count as 0.0, like column_data makes them
+def grouped_sums(df, col_name, bounds, key_codes, membership):
+    values = np.clip(df[col_name].fillna(0.).to_numpy(dtype=float), bounds[0], bounds[1])
+    has_key = key_codes >= 0
+    key_sums = np.bincount(key_codes[has_key], weights=values[has_key], minlength=membership.shape[0])
+    return key_sums @ membership
+
+
+"""
+Function to release differentially private sums of value columns for many groups of rows at
+once. The clamped values of every group are summed in one pass, and Laplacian noise is added to
+each column's vector of sums with one measurement, spending the budget once per column.
+Output: a dataframe of private sums, indexed by group with one column per value column.
+"""
+def release_grouped_sums(df, key_column, value_columns, bounds, groups=None, budget=0.5, max_contributions=1, verbose=True):
+    key_codes, membership, group_names, overlap = group_rows(df, key_column, groups)
+    dp_sums = {}
+    for col in value_columns:
+        col_bounds = bounds[col] if isinstance(bounds, dict) else bounds
+        # a row changes the sums of the groups it falls in by at most the clamped bound each
+        sensitivity = create_sum_trans(col_bounds, create_vector_space(float)).map(d_in=max_contributions) * overlap
+        sum_meas = make_meas(create_sum_space(len(group_names)), budget=budget, max_contributions=sensitivity, verbose=verbose)
+        dp_sums[col] = sum_meas(grouped_sums(df, col, col_bounds, key_codes, membership).tolist())
+    return pd.DataFrame(dp_sums, index=group_names, columns=value_columns)
+
+
+"""
+Function to release differentially private means of value columns for many groups of rows at
+once, from a private count of every group and private sums of each value column. Counts and
+clamped sums of all groups are computed in one pass and each vector gets noise from one
+measurement, so the release spends the budget once for the counts and once per value column.
+Means are the private sums over the private counts, clamped to the bounds, and come with the
+bounds of an interval holding the mean with (1 - alpha) confidence.
+Output: a dataframe indexed by group with the private 'count', and '<col>-sum', '<col>-mean',
+'<col>-lower' and '<col>-upper' for each value column.
+"""
+def release_grouped_means(df, key_column, value_columns, bounds, groups=None, budget=0.5, max_contributions=1,
+                          alpha=0.05, verbose=True):
+    key_codes, membership, group_names, overlap = group_rows(df, key_column, groups)
+    out = {}
+
+    # private count of every group
+    has_key = key_codes >= 0
+    counts = np.bincount(key_codes[has_key], minlength=membership.shape[0]) @ membership
+    count_space = create_histogram_space(len(group_names))
+    count_meas = make_meas(count_space, budget=budget, max_contributions=max_contributions * overlap, verbose=verbose)
+    dp_counts = np.array(count_meas(counts.tolist()))
+    out['count'] = dp_counts
+    # split alpha between the count and the sum the interval of a mean depends on
+    count_scale = scale_cache.calibrate(count_space, budget, max_contributions * overlap)
+    count_accuracy = laplacian_scale_to_accuracy(count_scale, alpha / 2)
+
+    for col in value_columns:
+        col_bounds = bounds[col] if isinstance(bounds, dict) else bounds
+        sensitivity = create_sum_trans(col_bounds, create_vector_space(float)).map(d_in=max_contributions) * overlap
+        sum_space = create_sum_space(len(group_names))
+        sum_meas = make_meas(sum_space, budget=budget, max_contributions=sensitivity, verbose=verbose)
+        dp_sums = np.array(sum_meas(grouped_sums(df, col, col_bounds, key_codes, membership).tolist()))
+        sum_accuracy = laplacian_scale_to_accuracy(scale_cache.calibrate(sum_space, budget, sensitivity), alpha / 2)
+
+        out[col + '-sum'] = dp_sums
+        out[col + '-mean'] = np.clip(dp_sums / np.maximum(dp_counts, 1), col_bounds[0], col_bounds[1])
+        # extremes of the sum over the count within their accuracies, or the bounds themselves
+        # when the count could be zero
+        lower, upper = np.full(len(group_names), col_bounds[0]), np.full(len(group_names), col_bounds[1])
+        positive = dp_counts - count_accuracy > 0
+        ratios = [(dp_sums[positive] + s) / (dp_counts[positive] + c)
+                  for s in [-sum_accuracy, sum_accuracy] for c in [-count_accuracy, count_accuracy]]
+        lower[positive] = np.clip(np.min(ratios, axis=0), col_bounds[0], col_bounds[1])
+        upper[positive] = np.clip(np.max(ratios, axis=0), col_bounds[0], col_bounds[1])
+        out[col + '-lower'] = lower
+        out[col + '-upper'] = upper
+
+    return pd.DataFrame(out, index=group_names)
+
+
 # create a counting transformation
 def create_count_trans(col_trans):
     count_trans = (
@@ -18,10 +18,8 @@ printed_columns = ['email', 'affiliation', 'num_emails_sent']
 df = pd.read_csv("../dataframes/sent_received_length_df.csv", usecols=printed_columns)
 # each person can only contribute one row
 max_contributions = 1
-# define metadata according to df structure
-metadata = {"column_names": ['index'] + list(df.columns)}
-# create column transformation
-col_trans = create_col_trans('num_emails_sent', str, metadata)
+# create the input space of the column
+col_trans = create_vector_space(str)
 # redefine counting measurement to take in scale as an argument
 def make_count_meas(scale):
     return (